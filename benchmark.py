@@ -0,0 +1,230 @@
+"""Offline benchmark of main.py against recorded query results.
+
+Record fixtures once against a live account (see replay_session.py), then
+from the app directory:
+
+    python benchmark.py bench/fixtures                    # compare with bench_baseline.json
+    python benchmark.py bench/fixtures --update-baseline  # accept the current numbers
+    python benchmark.py bench/fixtures --latency 0.2      # simulate a slower warehouse
+
+The app is driven through Streamlit's AppTest: a few cold runs with empty
+caches and result store, each followed by a warm rerun, then every
+combination of each section's widgets while the other sections keep their
+defaults. Function times come from the result cache and include the cached
+functions each one calls.
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, Iterator, List
+
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+from streamlit.testing.v1.element_tree import Selectbox
+
+import deck_payload
+from result_cache import ResultCache
+
+# Widget labels of each section, in the order they are set; a later widget
+# may depend on an earlier one, like the resolution range on the scale.
+SECTIONS = {
+    "Visualisation 1": ["H3 resolution", "Levels"],
+    "Visualisation 2": ["Scale of polygon", "Show original shape", "H3 resolution "],
+    "Visualisation 3": ["H3 resolution  ", "Style schema "],
+    "Visualisation 4": ["H3 resolution     ", "Style schema     "],
+}
+
+
+class Recorder:
+    """Times cached computations and measures the deck payload of each run."""
+
+    def __init__(self):
+        self.functions: Dict[str, List[float]] = defaultdict(list)
+        self.media: Dict[str, int] = {}
+        self._seen_media = set()
+
+    def reset(self) -> None:
+        """Start over, as for a new browser session against empty caches."""
+        self.functions.clear()
+        self._seen_media.clear()
+
+    def install(self) -> None:
+        get_or_compute = ResultCache.get_or_compute
+        media_url = deck_payload._media_url
+        functions, media = self.functions, self.media
+
+        def timed_get_or_compute(cache, key, compute, update=None):
+            def timed():
+                started = time.perf_counter()
+                try:
+                    return compute()
+                finally:
+                    functions[f"{key[0]}.{key[1]}"].append(time.perf_counter() - started)
+            return get_or_compute(cache, key, timed, update)
+
+        def recorded_media_url(data, coordinates):
+            url = media_url(data, coordinates)
+            media[coordinates] = len(data)
+            return url
+
+        ResultCache.get_or_compute = timed_get_or_compute
+        deck_payload._media_url = recorded_media_url
+
+    def run(self, at: AppTest) -> Dict[str, float]:
+        self.media.clear()
+        started = time.perf_counter()
+        at.run()
+        seconds = time.perf_counter() - started
+        if at.exception:
+            raise SystemExit(f"main.py raised: {at.exception[0].value}")
+        charts = [len(chart.proto.json) for chart in at.get("deck_gl_json_chart")]
+        # Media files the browser has fetched before are served from its cache.
+        new_media = sum(size for name, size in self.media.items() if name not in self._seen_media)
+        self._seen_media.update(self.media)
+        return {"seconds": seconds, "chart_bytes": max(charts, default=0),
+                "json_bytes": sum(charts), "media_bytes": new_media}
+
+
+def widget(at: AppTest, label: str):
+    for element in list(at.slider) + list(at.selectbox):
+        if element.label == label:
+            return element
+    raise SystemExit(f"main.py has no widget labelled {label!r}")
+
+
+def widget_values(element) -> list:
+    if isinstance(element, Selectbox):
+        return list(element.options)
+    return list(range(int(element.min), int(element.max) + 1))
+
+
+def sweep(at: AppTest, recorder: Recorder, labels: List[str]) -> Iterator[Dict[str, float]]:
+    if not labels:
+        return
+    for value in widget_values(widget(at, labels[0])):
+        widget(at, labels[0]).set_value(value)
+        yield recorder.run(at)
+        yield from sweep(at, recorder, labels[1:])
+
+
+def peak_rss_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def cold_start(fixtures: str, latency: float, timeout: float, recorder: Recorder):
+    """A new session against empty caches and result store, and its first two runs."""
+    at = AppTest.from_file("main.py", default_timeout=timeout)
+    at.secrets["replay"] = {"fixtures": fixtures, "latency": latency}
+    at.secrets["result_store"] = {"directory": tempfile.mkdtemp(prefix="bench_store_")}
+    st.cache_resource.clear()
+    st.cache_data.clear()
+    recorder.reset()
+    return at, recorder.run(at), recorder.run(at)
+
+
+def benchmark(fixtures: str, latency: float, timeout: float, repeat: int = 3) -> dict:
+    recorder = Recorder()
+    recorder.install()
+    # One cold run is too noisy to gate on, so the app is started ``repeat``
+    # times and the median taken; the widget sweep runs in the last session.
+    starts = [cold_start(fixtures, latency, timeout, recorder) for _ in range(repeat)]
+    at, cold, warm = starts[-1]
+    runs = []
+    for section, labels in SECTIONS.items():
+        defaults = [widget(at, label).value for label in labels]
+        section_runs = list(sweep(at, recorder, labels))
+        print(f"{section}: {len(section_runs)} reruns, slowest {max(r['seconds'] for r in section_runs):.2f}s")
+        runs += section_runs
+        for label, value in zip(labels, defaults):
+            widget(at, label).set_value(value)
+            recorder.run(at)
+
+    return {
+        "cold_run_seconds": statistics.median(start[1]["seconds"] for start in starts),
+        "warm_run_seconds": statistics.median(start[2]["seconds"] for start in starts),
+        "rerun_median_seconds": statistics.median(r["seconds"] for r in runs),
+        "rerun_max_seconds": max(r["seconds"] for r in runs),
+        "peak_rss_bytes": peak_rss_bytes(),
+        "cold_payload_bytes": cold["json_bytes"] + cold["media_bytes"],
+        "chart_max_bytes": max(r["chart_bytes"] for r in [cold, warm, *runs]),
+        "rerun_payload_max_bytes": max(r["json_bytes"] + r["media_bytes"] for r in runs),
+        "functions": {name: {"calls": len(times), "total_seconds": sum(times), "max_seconds": max(times)}
+                      for name, times in sorted(recorder.functions.items())},
+    }
+
+
+def flatten(metrics: dict, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for name, value in metrics.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{name}."))
+        else:
+            flat[f"{prefix}{name}"] = value
+    return flat
+
+
+def regressions(current: dict, baseline: dict, tolerance: float, slack: float) -> List[str]:
+    current, found = flatten(current), []
+    for name, base in flatten(baseline).items():
+        # A single call's time is too noisy to gate on; its total is not.
+        if name not in current or name.endswith(".max_seconds"):
+            continue
+        # Short timings are mostly noise, so they also get an absolute allowance.
+        limit = base * (1 + tolerance) + (slack if name.endswith("_seconds") else 0)
+        if current[name] > limit:
+            found.append(f"{name}: {current[name]:.4g} > {limit:.4g} (baseline {base:.4g})")
+    return found
+
+
+def report(metrics: dict) -> None:
+    print(f"cold run {metrics['cold_run_seconds']:.2f}s, warm rerun {metrics['warm_run_seconds']:.2f}s, "
+          f"widget reruns {metrics['rerun_median_seconds']:.2f}s median / {metrics['rerun_max_seconds']:.2f}s max")
+    print(f"peak RSS {metrics['peak_rss_bytes'] / 1e6:.0f} MB, cold payload {metrics['cold_payload_bytes'] / 1e6:.2f} MB, "
+          f"largest chart {metrics['chart_max_bytes'] / 1e6:.2f} MB, "
+          f"largest rerun payload {metrics['rerun_payload_max_bytes'] / 1e6:.2f} MB")
+    functions = sorted(metrics["functions"].items(), key=lambda item: -item[1]["total_seconds"])
+    for name, stats in functions:
+        print(f"  {stats['total_seconds']:8.3f}s total {stats['max_seconds']:8.3f}s max {stats['calls']:5d} calls  {name}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("fixtures", help="result store directory recorded with prewarm.py")
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated seconds per statement")
+    parser.add_argument("--baseline", default="bench_baseline.json")
+    parser.add_argument("--update-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative increase over the baseline")
+    parser.add_argument("--slack", type=float, default=0.05, help="allowed absolute increase of timings, in seconds")
+    parser.add_argument("--repeat", type=int, default=3, help="cold starts to take the median of")
+    parser.add_argument("--timeout", type=float, default=600.0, help="seconds allowed for one run of main.py")
+    args = parser.parse_args()
+
+    metrics = benchmark(args.fixtures, args.latency, args.timeout, args.repeat)
+    report(metrics)
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(metrics, f, indent=2, sort_keys=True)
+        print(f"baseline written to {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        print(f"no baseline at {args.baseline}; run with --update-baseline to record one")
+        return
+    with open(args.baseline) as f:
+        found = regressions(metrics, json.load(f), args.tolerance, args.slack)
+    for line in found:
+        print(f"REGRESSION {line}")
+    if found:
+        sys.exit(1)
+    print(f"no regressions against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+from typing import List, NamedTuple, Sequence, Tuple, Union
+
+import numpy as np
+
+NAMED_COLORS = {
+    "gray": "#808080",
+    "blue": "#0000FF",
+    "green": "#008000",
+    "yellow": "#FFFF00",
+    "orange": "#FFA500",
+    "red": "#FF0000",
+}
+
+
+class ColorScheme(NamedTuple):
+    quantiles: List[float]
+    colors: List[str]
+    legend: str
+
+
+COLOR_SCHEMES = {
+    "Contrast": ColorScheme([0, 0.25, 0.5, 0.75, 1],
+                            ['gray', 'blue', 'green', 'yellow', 'orange', 'red'],
+                            './img/gradient_c.png'),
+    "Snowflake": ColorScheme([0, 0.33, 0.66, 1],
+                             ['#666666', '#24BFF2', '#126481', '#D966FF'],
+                             './img/gradient_sf.jpg'),
+}
+
+
+def parse_color(color: Union[str, Sequence[float]]) -> Tuple[float, float, float, float]:
+    if isinstance(color, (tuple, list)):
+        return tuple(tuple(color) + (1.0,))[:4]
+    code = NAMED_COLORS.get(color.lower(), color)
+    if not (code.startswith("#") and len(code) == 7):
+        raise ValueError(f"Unrecognized color code {color!r}")
+    return (int(code[1:3], 16) / 255.0, int(code[3:5], 16) / 255.0, int(code[5:7], 16) / 255.0, 1.0)
+
+
+def linear_colors(values: np.ndarray, colors: Sequence, index: Sequence[float], alpha: bool = False) -> np.ndarray:
+    """Interpolate ``colors`` placed at ``index`` for every value.
+
+    Returns a contiguous uint8 array of shape (N, 3), or (N, 4) with
+    ``alpha``, matching branca's ``LinearColormap.rgb(a)_bytes_tuple``
+    value for value, including its handling of a color list longer than
+    the index.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    index = np.asarray(index, dtype=np.float64)
+    if np.any(np.diff(index) < 0):
+        raise ValueError("Thresholds are not sorted.")
+    stops = np.array([parse_color(color) for color in colors], dtype=np.float64)
+
+    upper = np.clip(np.searchsorted(index, values, side="left"), 1, len(index) - 1)
+    low, high = index[upper - 1], index[upper]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p = np.where(low < high, (values - low) * 1.0 / (high - low), 1.0)[:, None]
+    rgba = (1.0 - p) * stops[upper - 1] + p * stops[upper]
+    rgba[values >= index[-1]] = stops[-1]
+    rgba[values <= index[0]] = stops[0]
+
+    channels = 4 if alpha else 3
+    return np.ascontiguousarray((rgba[:, :channels] * 255.9999).astype(np.uint8))
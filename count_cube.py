@@ -0,0 +1,60 @@
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from data_access import column_to_numpy
+from h3_grid import cell_to_parent
+
+
+def rollup_counts(cells: np.ndarray, counts: np.ndarray, resolution: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Sum ``counts`` of finer ``cells`` into their parents at ``resolution``."""
+    parents = cell_to_parent(cells, resolution)
+    grouped = pd.Series(counts).groupby(parents, sort=False).sum()
+    return grouped.index.to_numpy(dtype=np.uint64), grouped.to_numpy()
+
+
+class CountCube:
+    """Per-cell counts fetched once at the finest resolution a widget offers.
+
+    Every coarser resolution is a local rollup, so moving a resolution
+    slider never goes back to the warehouse.
+    """
+
+    def __init__(self, cells: np.ndarray, counts: np.ndarray, resolution: int, watermark: Optional[str] = None):
+        self.cells = np.asarray(cells, dtype=np.uint64)
+        self.counts = np.asarray(counts, dtype=np.int64)
+        self.resolution = resolution
+        # Highest value of the source's watermark column counted so far, for
+        # cubes refreshed incrementally.
+        self.watermark = watermark
+
+    @classmethod
+    def from_batches(cls, batches: Iterable[pa.RecordBatch], resolution: int) -> "CountCube":
+        # Only the integer columns of each batch are kept, so the working set
+        # is the compact NumPy result plus one Arrow batch in flight.
+        cells, counts = [], []
+        for batch in batches:
+            cells.append(column_to_numpy(batch, "H3", np.uint64))
+            counts.append(column_to_numpy(batch, "COUNT", np.int64))
+        if not cells:
+            return cls(np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.int64), resolution)
+        return cls(np.concatenate(cells), np.concatenate(counts), resolution)
+
+    def merge(self, other: "CountCube", watermark: Optional[str] = None) -> "CountCube":
+        """Cube holding the counts of both, such as a cube and the rows added since its watermark."""
+        if other.resolution != self.resolution:
+            raise ValueError(f"Cannot merge a resolution {other.resolution} cube into a resolution {self.resolution} one")
+        cells, counts = rollup_counts(np.concatenate([self.cells, other.cells]),
+                                      np.concatenate([self.counts, other.counts]), self.resolution)
+        return CountCube(cells, counts, self.resolution, watermark)
+
+    def at(self, resolution: int) -> pd.DataFrame:
+        if resolution > self.resolution:
+            raise ValueError(f"Cube holds counts down to resolution {self.resolution}, not {resolution}")
+        if resolution == self.resolution:
+            cells, counts = self.cells, self.counts
+        else:
+            cells, counts = rollup_counts(self.cells, self.counts, resolution)
+        return pd.DataFrame({"H3": cells, "COUNT": counts})
@@ -0,0 +1,107 @@
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+import perf
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class FetchStats:
+    query: str
+    query_id: Optional[str] = None
+    rows: int = 0
+    bytes: int = 0
+    batches: int = 0
+    seconds: float = 0.0
+    started: float = field(default_factory=time.perf_counter, repr=False)
+
+
+def iter_arrow_batches(session: Any, query: str) -> Iterator[pa.RecordBatch]:
+    """Stream the result of ``query`` as Arrow record batches.
+
+    Uses the connector's Arrow result chunks when the session exposes a
+    ``connection`` (Snowpark), so no per-value Python objects are built.
+    Sessions without one, such as local stand-ins, fall back to
+    ``session.sql(query).to_pandas()``.
+    """
+    stats = FetchStats(query)
+    try:
+        connection = getattr(session, "connection", None)
+        if connection is not None:
+            cursor = connection.cursor()
+            try:
+                cursor.execute(query)
+                stats.query_id = cursor.sfqid
+                for table in cursor.fetch_arrow_batches():
+                    for batch in table.to_batches():
+                        _count(stats, batch)
+                        yield batch
+            finally:
+                cursor.close()
+        else:
+            table = pa.Table.from_pandas(session.sql(query).to_pandas(), preserve_index=False)
+            for batch in table.to_batches():
+                _count(stats, batch)
+                yield batch
+    finally:
+        stats.seconds = time.perf_counter() - stats.started
+        perf.add_fetch(stats)
+        logger.info("fetched %d rows / %d bytes in %d batches (%.3fs, query id %s)",
+                    stats.rows, stats.bytes, stats.batches, stats.seconds, stats.query_id)
+
+
+def _count(stats: FetchStats, batch: pa.RecordBatch) -> None:
+    stats.rows += batch.num_rows
+    stats.bytes += batch.nbytes
+    stats.batches += 1
+
+
+def table_from_batches(batches: Iterable[pa.RecordBatch]) -> pa.Table:
+    batches = list(batches)
+    return pa.Table.from_batches(batches) if batches else pa.table({})
+
+
+def pandas_from_batches(batches: Iterable[pa.RecordBatch]) -> pd.DataFrame:
+    # The table is private to this call, so Arrow may release each column
+    # as soon as pandas owns it instead of holding both copies at once.
+    return table_from_batches(batches).to_pandas(split_blocks=True, self_destruct=True)
+
+
+def cells_from_batches(batches: Iterable[pa.RecordBatch], column: str = "H3") -> np.ndarray:
+    chunks = [column_to_numpy(batch, column, np.uint64) for batch in batches]
+    return np.concatenate(chunks) if chunks else np.empty(0, dtype=np.uint64)
+
+
+def cells_by_from_batches(batches: Iterable[pa.RecordBatch], keys: Sequence[str], column: str = "H3") -> Dict[Tuple[int, ...], np.ndarray]:
+    """Cells split by the integer ``keys`` columns they are tagged with."""
+    parts: Dict[str, List[np.ndarray]] = {name: [] for name in [*keys, column]}
+    for batch in batches:
+        for name in keys:
+            parts[name].append(column_to_numpy(batch, name, np.int64))
+        parts[column].append(column_to_numpy(batch, column, np.uint64))
+    if not parts[column]:
+        return {}
+    tags = np.stack([np.concatenate(parts[name]) for name in keys], axis=1)
+    cells = np.concatenate(parts[column])
+    groups, inverse = np.unique(tags, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    return {tuple(int(v) for v in group): cells[inverse == i] for i, group in enumerate(groups)}
+
+
+def column_to_numpy(batch: pa.RecordBatch, name: str, dtype: np.dtype) -> np.ndarray:
+    """Integer column as NumPy, without a copy when the Arrow type allows it."""
+    column = batch.column(name)
+    if pa.types.is_decimal(column.type):
+        column = pc.cast(column, pa.int64())
+    values = column.to_numpy(zero_copy_only=False)
+    if values.dtype.itemsize == np.dtype(dtype).itemsize and values.dtype.kind in "iu":
+        return values.view(dtype)
+    return values.astype(dtype)
@@ -0,0 +1,89 @@
+"""Compact JSON for st.pydeck_chart.
+
+pydeck serializes every layer record through Python dicts, indented, on
+each rerun. Here a deck is serialized once: layer data comes straight from
+``DataFrame.to_json`` with only the columns the layer reads, colours are
+packed into one integer, and large data is published as a media file, so
+decks and reruns sharing it send a URL instead of the records.
+"""
+import hashlib
+import json
+from typing import TYPE_CHECKING, Dict, Mapping, Optional
+
+import numpy as np
+import pandas as pd
+
+import perf
+
+if TYPE_CHECKING:
+    import pydeck as pdk
+
+# deck.gl accessor unpacking a COLOR column written by pack_colors.
+PACKED_COLOR = "[(COLOR >> 16) & 255, (COLOR >> 8) & 255, COLOR & 255]"
+# Layer data at least this large is served once as a media file.
+SHARED_DATA_MIN_BYTES = 64 * 1024
+# About a centimetre, finer than any H3 cell or shape the app draws.
+COORDINATE_DIGITS = 7
+
+
+def pack_colors(colors: np.ndarray) -> np.ndarray:
+    """N x 3 uint8 RGB as N 0xRRGGBB integers."""
+    rgb = colors[:, :3].astype(np.uint32)
+    return (rgb[:, 0] << 16) | (rgb[:, 1] << 8) | rgb[:, 2]
+
+
+class DeckPayload:
+    """A deck serialized once, with the attributes st.pydeck_chart reads."""
+
+    def __init__(self, body: str, shared: Dict[str, bytes], tooltip: Optional[dict]):
+        self.body = body
+        self.shared = shared
+        self._tooltip = tooltip
+
+    @perf.timed
+    def to_json(self) -> str:
+        # Media files only live as long as a rerun uses them, so they are
+        # published again on every call; an unchanged file keeps its URL.
+        # Layers with identical data share a token, so every use is replaced.
+        body = self.body
+        for token, data in self.shared.items():
+            url = _media_url(data, token)
+            body = body.replace(json.dumps(token), json.dumps(url) if url else data.decode())
+        return body
+
+
+@perf.timed
+def build_payload(deck: "pdk.Deck", frames: Mapping[str, pd.DataFrame]) -> DeckPayload:
+    """Serialize ``deck``, taking the data of each layer id in ``frames`` from that frame.
+
+    The frames should hold just the columns the layer's accessors and the
+    tooltip read.
+    """
+    spec = json.loads(deck.to_json())
+    inline, shared = {}, {}
+    for layer in spec["layers"]:
+        frame = frames.get(layer["id"])
+        if frame is None:
+            continue
+        data = frame.to_json(orient="records", double_precision=COORDINATE_DIGITS).encode()
+        token = f"deck_payload.{hashlib.sha1(data).hexdigest()}"
+        layer["data"] = token
+        if len(data) >= SHARED_DATA_MIN_BYTES:
+            shared[token] = data
+        else:
+            inline[json.dumps(token)] = data.decode()
+    body = json.dumps(spec, separators=(",", ":"), sort_keys=True)
+    for token, data in inline.items():
+        body = body.replace(token, data)
+    return DeckPayload(body, shared, getattr(deck, "_tooltip", None))
+
+
+def _media_url(data: bytes, coordinates: str) -> Optional[str]:
+    from streamlit import config, runtime
+    if not runtime.exists():
+        return None
+    url = runtime.get_instance().media_file_mgr.add(data, "application/json", coordinates)
+    # Unlike st.image, deck.gl fetches the URL as given, so it needs the
+    # server's base path.
+    base = config.get_option("server.baseUrlPath").strip("/")
+    return f"/{base}{url}" if base else url
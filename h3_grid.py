@@ -0,0 +1,86 @@
+from functools import lru_cache
+from typing import List
+
+import numpy as np
+
+# H3 index layout (mode 1, cell): bits 59-62 mode, 52-55 resolution,
+# 45-51 base cell, 0-44 fifteen 3-bit digits (7 = unused).
+MAX_GRID_RES = 4
+BASE_CELL_COUNT = 122
+PENTAGON_BASE_CELLS = (4, 14, 24, 38, 49, 58, 63, 72, 83, 97, 107, 117)
+
+_MODE_CELL = np.uint64(1 << 59)
+_RES_SHIFT = np.uint64(52)
+_RES_MASK = np.uint64(0xF << 52)
+_BASE_SHIFT = np.uint64(45)
+_DIGITS_MASK = np.uint64((1 << 45) - 1)
+_HEX_DIGITS = np.frombuffer(b"0123456789abcdef", dtype=np.uint8)
+_NIBBLE_SHIFTS = np.arange(56, -1, -4, dtype=np.uint64)
+
+
+def _digit_shift(resolution: int) -> np.uint64:
+    return np.uint64((15 - resolution) * 3)
+
+
+def get_resolution(cells: np.ndarray) -> np.ndarray:
+    return ((np.asarray(cells, dtype=np.uint64) & _RES_MASK) >> _RES_SHIFT).astype(np.int8)
+
+
+def get_base_cell(cells: np.ndarray) -> np.ndarray:
+    return ((np.asarray(cells, dtype=np.uint64) >> _BASE_SHIFT) & np.uint64(0x7F)).astype(np.int16)
+
+
+def base_cells() -> np.ndarray:
+    numbers = np.arange(BASE_CELL_COUNT, dtype=np.uint64)
+    return _MODE_CELL | (numbers << _BASE_SHIFT) | _DIGITS_MASK
+
+
+def is_pentagon(cells: np.ndarray) -> np.ndarray:
+    cells = np.asarray(cells, dtype=np.uint64)
+    resolution = get_resolution(cells).astype(np.uint64)
+    # A cell is a pentagon when its base cell is one and every used digit is 0.
+    used_bits = resolution * np.uint64(3)
+    used_digits = (cells & _DIGITS_MASK) >> (np.uint64(45) - used_bits)
+    return np.isin(get_base_cell(cells), PENTAGON_BASE_CELLS) & (used_digits == 0)
+
+
+def cell_to_children(cells: np.ndarray, resolution: int) -> np.ndarray:
+    """Children of same-resolution ``cells`` one level finer, in index order."""
+    cells = np.asarray(cells, dtype=np.uint64)
+    shift = _digit_shift(resolution)
+    cleared = (cells & ~_RES_MASK & ~(np.uint64(7) << shift)) | (np.uint64(resolution) << _RES_SHIFT)
+    children = cleared[:, None] | (np.arange(7, dtype=np.uint64) << shift)[None, :]
+    # Pentagons have no child in the deleted K-axes subsequence (digit 1).
+    keep = np.ones(children.shape, dtype=bool)
+    keep[is_pentagon(cells), 1] = False
+    return children[keep]
+
+
+def cell_to_parent(cells: np.ndarray, resolution: int) -> np.ndarray:
+    cells = np.asarray(cells, dtype=np.uint64)
+    unused = np.uint64((1 << ((15 - resolution) * 3)) - 1)
+    return (cells & ~_RES_MASK) | (np.uint64(resolution) << _RES_SHIFT) | unused
+
+
+@lru_cache(maxsize=1)
+def _grid_index() -> List[np.ndarray]:
+    levels = [base_cells()]
+    for resolution in range(1, MAX_GRID_RES + 1):
+        levels.append(cell_to_children(levels[-1], resolution))
+    for level in levels:
+        level.setflags(write=False)
+    return levels
+
+
+def grid_cells(resolution: int) -> np.ndarray:
+    """Every H3 cell of the globe at ``resolution`` (0..MAX_GRID_RES) as uint64."""
+    if not 0 <= resolution <= MAX_GRID_RES:
+        raise ValueError(f"Grid resolution must be between 0 and {MAX_GRID_RES}, got {resolution}")
+    return _grid_index()[resolution]
+
+
+def cells_to_strings(cells: np.ndarray) -> np.ndarray:
+    cells = np.ascontiguousarray(cells, dtype=np.uint64)
+    nibbles = (cells[:, None] >> _NIBBLE_SHIFTS) & np.uint64(0xF)
+    chars = np.ascontiguousarray(_HEX_DIGITS[nibbles.astype(np.intp)])
+    return chars.view("S15").ravel().astype(str)
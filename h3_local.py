@@ -0,0 +1,187 @@
+"""Local stand-ins for Snowflake's H3_POLYGON_TO_CELLS and H3_COVERAGE.
+
+``polygon_to_cells`` is centroid based and planar, like Snowflake's
+function. ``coverage`` returns every cell that intersects the polygon when
+its edges are taken as great-circle arcs, the way GEOGRAPHY treats them.
+"""
+import os
+import sys
+from typing import Dict, List, Tuple
+
+import h3.api.basic_int as h3
+import numpy as np
+import pandas as pd
+
+# Same order as functions_2 in queries.py, which tags the Snowflake results.
+FUNCTIONS = ("h3_coverage", "h3_polygon_to_cells")
+_MAX_BOUNDARY_VERTICES = 10
+_EDGE_SAMPLES = 64
+# Generous bound on a cell's center-to-vertex distance, in average edge
+# lengths, covering H3's size distortion across the globe.
+_CELL_RADIUS_EDGES = 2.0
+_EARTH_RADIUS_KM = 6371.0088
+
+
+def parse_polygon(wkt: str) -> List[Tuple[float, float]]:
+    """Outer ring of a WKT POLYGON as (lng, lat) pairs, closing vertex dropped."""
+    body = wkt.strip()
+    if not body.upper().startswith("POLYGON"):
+        raise ValueError(f"Only POLYGON WKT is supported, got {wkt[:30]!r}")
+    ring = body[body.index("((") + 2:body.index(")")]
+    points = [tuple(float(v) for v in point.split()) for point in ring.split(",")]
+    return points[:-1] if points[0] == points[-1] else points
+
+
+def polygon_to_cells(wkt: str, resolution: int) -> np.ndarray:
+    ring = parse_polygon(wkt)
+    shape = h3.LatLngPoly([(lat, lng) for lng, lat in ring])
+    return np.array(sorted(h3.polygon_to_cells(shape, resolution)), dtype=np.uint64)
+
+
+def coverage(wkt: str, resolution: int) -> np.ndarray:
+    polygon = _to_vectors(np.array(parse_polygon(wkt)))
+    candidates = _candidate_cells(polygon, resolution)
+    if len(candidates) == 0:
+        return candidates
+    centers = _to_vectors(np.array([h3.cell_to_latlng(int(cell))[::-1] for cell in candidates]))
+    inside = _winding_contains(polygon[None, :, :], centers)
+
+    # Only cells within a cell radius of an edge's great circle can straddle
+    # the boundary; every other cell is decided by its center alone.
+    normals = np.cross(polygon, np.roll(polygon, -1, axis=0))
+    normals /= np.linalg.norm(normals, axis=-1, keepdims=True)
+    radius = _CELL_RADIUS_EDGES * h3.average_hexagon_edge_length(resolution, unit="km") / _EARTH_RADIUS_KM
+    near = np.any(np.abs(centers @ normals.T) < np.sin(radius), axis=1)
+
+    # A boundary cell intersects the polygon when its center is inside, it
+    # holds one of the polygon's vertices, or one of its edges crosses a
+    # polygon edge.
+    boundaries = _to_vectors(_padded_boundaries(candidates[near]))
+    touches = inside[near] | _edges_cross(boundaries, polygon)
+    for vertex in polygon:
+        touches |= _winding_contains(boundaries, np.broadcast_to(vertex, (len(boundaries), 3)))
+    covered = inside.copy()
+    covered[near] = touches
+    return np.sort(candidates[covered])
+
+
+def spherical_outline(wkt: str, samples_per_edge: int = _EDGE_SAMPLES) -> List[List[float]]:
+    """Closed [lng, lat] ring with every edge densified along its great circle."""
+    polygon = _to_vectors(np.array(parse_polygon(wkt)))
+    start, end = polygon, np.roll(polygon, -1, axis=0)
+    t = np.linspace(0.0, 1.0, samples_per_edge, endpoint=False)[None, :, None]
+    samples = start[:, None, :] * (1 - t) + end[:, None, :] * t
+    samples /= np.linalg.norm(samples, axis=-1, keepdims=True)
+    ring = _to_lnglat(samples.reshape(-1, 3)).tolist()
+    return ring + ring[:1]
+
+
+def cells_for_range(wkt: str, min_res: int, max_res: int) -> Dict[Tuple[int, int], np.ndarray]:
+    """Same keys and values as the tagged Snowflake statement in queries.py."""
+    cells = {}
+    for resolution in range(min_res, max_res + 1):
+        cells[(FUNCTIONS.index("h3_coverage"), resolution)] = coverage(wkt, resolution)
+        cells[(FUNCTIONS.index("h3_polygon_to_cells"), resolution)] = polygon_to_cells(wkt, resolution)
+    return cells
+
+
+def _to_vectors(lnglat: np.ndarray) -> np.ndarray:
+    lng, lat = np.radians(lnglat[..., 0]), np.radians(lnglat[..., 1])
+    return np.stack([np.cos(lat) * np.cos(lng), np.cos(lat) * np.sin(lng), np.sin(lat)], axis=-1)
+
+
+def _to_lnglat(vectors: np.ndarray) -> np.ndarray:
+    lat = np.degrees(np.arcsin(np.clip(vectors[..., 2], -1.0, 1.0)))
+    lng = np.degrees(np.arctan2(vectors[..., 1], vectors[..., 0]))
+    return np.stack([lng, lat], axis=-1)
+
+
+def _candidate_cells(polygon: np.ndarray, resolution: int) -> np.ndarray:
+    # The lat/lng bounding box of the great-circle edges (sampled, so the
+    # bulge of long edges is included), grown by two cell edge lengths.
+    start, end = polygon, np.roll(polygon, -1, axis=0)
+    t = np.linspace(0.0, 1.0, _EDGE_SAMPLES)[None, :, None]
+    samples = start[:, None, :] * (1 - t) + end[:, None, :] * t
+    samples /= np.linalg.norm(samples, axis=-1, keepdims=True)
+    lnglat = _to_lnglat(samples.reshape(-1, 3))
+    margin = 2 * np.degrees(h3.average_hexagon_edge_length(resolution, unit="km") / _EARTH_RADIUS_KM)
+    south = max(lnglat[:, 1].min() - margin, -89.9)
+    north = min(lnglat[:, 1].max() + margin, 89.9)
+    lng_margin = margin / np.cos(np.radians(max(abs(south), abs(north))))
+    west, east = lnglat[:, 0].min() - lng_margin, lnglat[:, 0].max() + lng_margin
+    box = h3.LatLngPoly([(south, west), (south, east), (north, east), (north, west)])
+    return np.array(h3.polygon_to_cells(box, resolution), dtype=np.uint64)
+
+
+def _padded_boundaries(cells: np.ndarray) -> np.ndarray:
+    # Boundaries have 5-10 vertices; repeating the last one adds zero-length
+    # edges that neither wind nor cross.
+    boundaries = np.empty((len(cells), _MAX_BOUNDARY_VERTICES, 2))
+    for i, cell in enumerate(cells):
+        vertices = [(lng, lat) for lat, lng in h3.cell_to_boundary(int(cell))]
+        boundaries[i, :len(vertices)] = vertices
+        boundaries[i, len(vertices):] = vertices[-1]
+    return boundaries
+
+
+def _winding_contains(rings: np.ndarray, points: np.ndarray) -> np.ndarray:
+    """Whether each point lies inside its ring (rings: N x K x 3, points: N x 3)."""
+    a, b = rings, np.roll(rings, -1, axis=-2)
+    p = points[:, None, :]
+    # Signed angle subtended at p by each edge, from the tangent-plane
+    # projections of its end points.
+    cross = np.sum(p * np.cross(a, b), axis=-1)
+    dot = np.sum(a * b, axis=-1) - np.sum(p * a, axis=-1) * np.sum(p * b, axis=-1)
+    winding = np.arctan2(cross, dot).sum(axis=-1)
+    return np.abs(winding) > np.pi
+
+
+def _edges_cross(boundaries: np.ndarray, polygon: np.ndarray) -> np.ndarray:
+    """Whether any cell edge properly crosses any polygon edge (arcs under 180 degrees)."""
+    a, b = boundaries[:, :, None, :], np.roll(boundaries, -1, axis=1)[:, :, None, :]
+    c, d = polygon[None, None, :, :], np.roll(polygon, -1, axis=0)[None, None, :, :]
+    ab, cd = np.cross(a, b), np.cross(c, d)
+    side_c, side_d = np.sum(ab * c, axis=-1), np.sum(ab * d, axis=-1)
+    side_a, side_b = np.sum(cd * a, axis=-1), np.sum(cd * b, axis=-1)
+    # Opposite signs on both lines, and the intersection on the near side of
+    # the sphere rather than at its antipode.
+    straddles = (side_c * side_d < 0) & (side_a * side_b < 0)
+    same_half = np.sum((a + b) * (c + d), axis=-1) > 0
+    return np.any(straddles & same_half, axis=(1, 2))
+
+
+def validate(recorded: pd.DataFrame, wkt: str) -> pd.DataFrame:
+    """Compare the local engine with a recorded Snowflake result.
+
+    ``recorded`` has the FN, RES and H3 columns of the tagged statement in
+    queries.py; one row of agreement statistics is returned per function and
+    resolution.
+    """
+    rows = []
+    for (fn, resolution), expected in recorded.groupby(["FN", "RES"])["H3"]:
+        expected = expected.to_numpy(dtype=np.uint64)
+        local = coverage(wkt, resolution) if FUNCTIONS[fn] == "h3_coverage" else polygon_to_cells(wkt, resolution)
+        matched = np.intersect1d(expected, local).size
+        union = np.union1d(expected, local).size
+        rows.append({"function": FUNCTIONS[fn], "resolution": resolution, "snowflake": expected.size,
+                     "local": local.size, "missing": expected.size - matched, "extra": local.size - matched,
+                     "jaccard": matched / union if union else 1.0})
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    # Compares against the Visualisation 2 results prewarm.py (with the
+    # snowflake engine) or the app recorded in a result store directory.
+    from queries import cells_query_2, polygons_2
+    from result_store import ResultStore
+
+    if len(sys.argv) != 2 or not os.path.isdir(sys.argv[1]):
+        sys.exit("usage: python h3_local.py RESULT_STORE_DIRECTORY")
+    store = ResultStore(sys.argv[1])
+    for scale, wkt in polygons_2.items():
+        table = store.get(cells_query_2(scale))
+        if table is None:
+            print(f"{scale}: no recorded result at {store.path(cells_query_2(scale))}")
+            continue
+        print(f"{scale}:")
+        print(validate(table.to_pandas(), wkt).to_string(index=False))
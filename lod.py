@@ -0,0 +1,151 @@
+"""Level of detail for hexagon layers.
+
+A layer is cut down to what its deck can show: cells outside the view are
+dropped, then sparse, low-value cells are merged into their parents until
+the layer fits the hexagon budget. Only the initial view state is known on
+the server, so the bounds are padded for some panning.
+"""
+from typing import NamedTuple, Optional, Tuple
+
+import h3.api.basic_int as h3
+import numpy as np
+import pandas as pd
+
+from h3_grid import cell_to_parent, get_resolution
+
+# deck.gl's Web Mercator world is 512 pixels wide at zoom 0.
+_TILE_SIZE = 512
+# Cells are placed through their ancestors this many levels up, each
+# standing for up to 7 ** 3 = 343 of them.
+_PARENT_LEVELS = 3
+_KM_PER_DEGREE = 111.32
+
+
+class View(NamedTuple):
+    latitude: float
+    longitude: float
+    zoom: float
+    pitch: float = 0.0
+    # st.pydeck_chart's default size in the centered layout.
+    width: int = 704
+    height: int = 500
+
+
+def view_bounds(view: View, padding: float = 1.5) -> Tuple[float, float, float, float]:
+    """(west, south, east, north) in degrees, ``padding`` times the viewport.
+
+    West may be below -180 and east above 180 when the view spans the
+    antimeridian.
+    """
+    world = _TILE_SIZE * 2 ** view.zoom
+    x = (view.longitude + 180) / 360 * world
+    y = (1 - np.log(np.tan(np.pi / 4 + np.radians(view.latitude) / 2)) / np.pi) / 2 * world
+    # A pitched camera sees further towards the horizon.
+    half_width = view.width / 2 * padding
+    half_height = view.height / 2 * padding / np.cos(np.radians(view.pitch)) ** 2
+    if half_width * 2 >= world:
+        west, east = -180.0, 180.0
+    else:
+        west, east = (x - half_width) / world * 360 - 180, (x + half_width) / world * 360 - 180
+    top, bottom = max(y - half_height, 0.0), min(y + half_height, world)
+    north, south = (np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * v / world)))) for v in (top, bottom))
+    return west, float(south), east, float(north)
+
+
+def cell_centers(cells: np.ndarray) -> np.ndarray:
+    """Cell centers as an N x 2 array of (lng, lat)."""
+    centers = np.empty((len(cells), 2))
+    for i, cell in enumerate(cells.tolist()):
+        lat, lng = h3.cell_to_latlng(cell)
+        centers[i] = lng, lat
+    return centers
+
+
+def in_bounds(centers: np.ndarray, bounds: Tuple[float, float, float, float], margin: float = 0.0) -> np.ndarray:
+    """Whether each center lies in ``bounds`` grown by ``margin`` degrees of latitude (shrunk if negative)."""
+    west, south, east, north = bounds
+    inside = (centers[:, 1] >= south - margin) & (centers[:, 1] <= north + margin)
+    if east - west < 360:
+        # The same distance spans more degrees of longitude towards the poles.
+        lng_margin = margin / np.maximum(np.cos(np.radians(centers[:, 1])), 1e-6)
+        inside &= (centers[:, 0] - west + lng_margin) % 360 <= east - west + 2 * lng_margin
+    return inside
+
+
+def locate(cells: np.ndarray, view: View) -> np.ndarray:
+    """Whether each cell's center is in the padded ``view``.
+
+    The test runs on the unique ancestors ``_PARENT_LEVELS`` up; only the
+    children of ancestors straddling the bounds have their own centers
+    computed.
+    """
+    coarse = max(int(get_resolution(cells).min()) - _PARENT_LEVELS, 0)
+    parents, inverse = np.unique(cell_to_parent(cells, coarse), return_inverse=True)
+    inverse = inverse.ravel()
+    centers = cell_centers(parents)
+    bounds = view_bounds(view)
+    # Children lie within about one edge of their ancestor's center; twice
+    # the average edge also covers the hexagons stretched by the projection.
+    margin = 2 * h3.average_hexagon_edge_length(coarse, unit="km") / _KM_PER_DEGREE
+    inside = in_bounds(centers, bounds, -margin)
+    straddling = in_bounds(centers, bounds, margin) & ~inside
+    visible = inside[inverse]
+    check = np.flatnonzero(straddling[inverse])
+    visible[check] = in_bounds(cell_centers(cells[check]), bounds)
+    return visible
+
+
+def limit_hexagons(df: pd.DataFrame, view: View, budget: Optional[int], value: Optional[str] = None,
+                   min_resolution: int = 0) -> pd.DataFrame:
+    """At most ``budget`` rows of ``df`` (uint64 H3 column) for display in ``view``.
+
+    With a ``value`` column, the lowest-valued sibling groups are merged into
+    their parents, summing ``value``, no coarser than ``min_resolution``;
+    what is still over budget is dropped lowest value first. Without one,
+    the visible cells are replaced by their parents, level by level, until
+    they fit, so the whole view stays covered at a coarser resolution.
+    """
+    if not budget or len(df) <= budget:
+        return df
+    cells = df["H3"].to_numpy(dtype=np.uint64)
+    visible = locate(cells, view)
+    cells = cells[visible]
+    if value is None:
+        resolution = int(get_resolution(cells).max()) if len(cells) else 0
+        while len(cells) > budget and resolution > min_resolution:
+            resolution -= 1
+            cells = np.unique(cell_to_parent(cells, resolution))
+        return pd.DataFrame({"H3": cells})
+    values = df[value].to_numpy()[visible]
+    if len(cells) > budget:
+        cells, values = _merge_low_values(cells, values, budget, min_resolution)
+    if len(cells) > budget:
+        keep = np.sort(np.argsort(values, kind="stable")[-budget:])
+        cells, values = cells[keep], values[keep]
+    return pd.DataFrame({"H3": cells, value: values})
+
+
+def _merge_low_values(cells: np.ndarray, values: np.ndarray, budget: int,
+                      min_resolution: int) -> Tuple[np.ndarray, np.ndarray]:
+    resolutions = get_resolution(cells)
+    while len(cells) > budget:
+        resolution = int(resolutions.max())
+        if resolution <= min_resolution:
+            break
+        fine = resolutions == resolution
+        parents = cell_to_parent(cells[fine], resolution - 1)
+        groups = pd.Series(values[fine]).groupby(parents).agg(["sum", "size"])
+        siblings = groups[groups["size"] > 1].sort_values("sum", kind="stable")
+        if siblings.empty:
+            # Only lone cells left at this level: coarsen them all, so they
+            # can group with their neighbours one level up.
+            merged = groups
+        else:
+            saved = (siblings["size"] - 1).cumsum().to_numpy()
+            merged = siblings.iloc[:np.searchsorted(saved, len(cells) - budget) + 1]
+        kept = ~np.isin(parents, merged.index.to_numpy(dtype=np.uint64))
+        cells = np.concatenate([cells[~fine], cells[fine][kept], merged.index.to_numpy(dtype=np.uint64)])
+        values = np.concatenate([values[~fine], values[fine][kept], merged["sum"].to_numpy(dtype=values.dtype)])
+        resolutions = np.concatenate([resolutions[~fine], resolutions[fine][kept],
+                                      np.full(len(merged), resolution - 1, dtype=resolutions.dtype)])
+    return cells, values
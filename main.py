@@ -1,17 +1,69 @@
-import streamlit as st
+from __future__ import annotations
+
+import functools
+from typing import TYPE_CHECKING, List
+
 import pandas as pd
-import pydeck as pdk
-import branca.colormap as cm
-from snowflake.snowpark import Session
-from snowflake.snowpark.functions import col
-from typing import List
-import json
-from PIL import Image
-image = Image.open('./favicon.png')
-st.set_page_config(page_title="H3: Simplifying the World's Map", page_icon=image)
+import streamlit as st
+
+from colormap import COLOR_SCHEMES, linear_colors
+from deck_payload import PACKED_COLOR, DeckPayload, build_payload, pack_colors
+from h3_grid import cells_to_strings, grid_cells
+from lod import View, limit_hexagons
+import perf
+import queries as q
+from queries import cached
+
+if TYPE_CHECKING:
+    import pydeck as pdk
+
+st.set_page_config(page_title="H3: Simplifying the World's Map", page_icon='./favicon.png')
+
+# Timings, query ids and cache use of each rerun. [perf] enabled = true in
+# secrets.toml records every session, appending a JSON line per rerun to
+# log_file when set; ?perf in the URL records this session and shows them.
+perf_settings = st.secrets.get("perf", {})
+
+
+def perf_enabled() -> bool:
+    return perf_settings.get("enabled", False) or "perf" in st.query_params
+
+
+def fragment(func):
+    # A fragment's own reruns skip the page's begin_rerun and end_rerun, so
+    # they are recorded here.
+    @functools.wraps(func)
+    def run():
+        if not perf_enabled() or perf.current() is not None:
+            return func()
+        perf.begin_rerun()
+        try:
+            return func()
+        finally:
+            perf.end_rerun(perf_settings.get("log_file"))
+    return st.fragment(run)
+
+
+if perf_enabled():
+    perf.begin_rerun()
+
 st.header("H3: Simplifying the World's Map", divider="rainbow")
 
-session = Session.builder.configs(st.secrets["geodemo"]).create()
+# Most hexagons a single layer sends to the browser; [lod] max_hexagons = 0
+# in secrets.toml sends every cell.
+hexagon_budget = st.secrets.get("lod", {}).get("max_hexagons", 100_000)
+
+
+@perf.timed
+def with_cell_strings(df: pd.DataFrame) -> pd.DataFrame:
+    # Cells stay uint64 until a layer needs the hex ids deck.gl and tooltips expect.
+    return df.assign(H3=cells_to_strings(df["H3"].to_numpy()))
+
+
+@perf.timed
+def with_colors(df: pd.DataFrame, colors: List, index: pd.Series) -> pd.DataFrame:
+    return df.assign(COLOR=pack_colors(linear_colors(df["COUNT"].to_numpy(), colors, index.to_numpy())))
+
 # st.set_page_config(page_title="H3 in Streamlit", layout="wide")
 
 st.subheader("What is H3")
@@ -44,18 +96,22 @@ st.markdown("The lowest resolution is 0, at which the world is divided into 122
             " You can check different resolutions and play with hierarchy levels using the widget below. Hover on hexagons to see their IDs.")
 
 # ------ Visualisation 1 ---------
-@st.cache_resource(ttl="2d")
-def get_h3point_df(resolution: float, row_count: int) -> pd.DataFrame:
-    return session.sql(
-        f"select distinct h3_point_to_cell_string(ST_POINT(UNIFORM( -180 , 180 , random()), UNIFORM( -90 , 90 , random())), {resolution}) as h3 from table(generator(rowCount => {row_count}))"
-    ).to_pandas()
+def get_h3point_df(resolution: int) -> pd.DataFrame:
+    return pd.DataFrame({"H3": grid_cells(resolution)})
 
 
-@st.cache_resource(ttl="2d")
-def get_coverage_layer(df: pd.DataFrame, line_color: List) -> pdk.Layer:
+@cached
+def get_cells_lod_1(resolution: int, view: View) -> pd.DataFrame:
+    return limit_hexagons(get_h3point_df(resolution), view, hexagon_budget)
+
+
+@perf.timed
+def get_coverage_layer(layer_id: str, line_color: List) -> pdk.Layer:
+    import pydeck as pdk
     return pdk.Layer(
         "H3HexagonLayer",
-        df,
+        None,
+        id=layer_id,
         get_hexagon="H3",
         stroked=True,
         filled=False,
@@ -67,47 +123,58 @@ def get_coverage_layer(df: pd.DataFrame, line_color: List) -> pdk.Layer:
         line_width_min_pixels=1,
     )
 
-min_v_1, max_v_1, v_1, z_1, lon_1, lat_1 = ( 0, 2, 0, 1, 0.9982847947205775, 2.9819747220001886,)
-col1, col2 = st.columns([70, 30])
-with col1:
-    h3_resolut_1 = st.slider(
-        "H3 resolution", min_value=min_v_1, max_value=max_v_1, value=v_1)
-
-with col2:
-    levels_option = st.selectbox("Levels", ("One", "Two", "Three"))
 
-df = get_h3point_df(h3_resolut_1, 100000)
-layer_coverage_1 = get_coverage_layer(df, [36, 191, 242])
+@cached
+def get_deck_1(h3_resolut_1: int, levels_option: str, view_1: View) -> DeckPayload:
+    import pydeck as pdk
+    layer_coverage_1 = get_coverage_layer("coverage_1_level_0", [36, 191, 242])
+
+    visible_layers_coverage_1 = [layer_coverage_1]
+
+    if levels_option == "Two":
+        layer_coverage_1_level_1 = get_coverage_layer("coverage_1_level_1", [217, 102, 255])
+        visible_layers_coverage_1 = [layer_coverage_1, layer_coverage_1_level_1]
+
+    if levels_option == "Three":
+        layer_coverage_1_level_1 = get_coverage_layer("coverage_1_level_1", [217, 102, 255])
+        layer_coverage_1_level2 = get_coverage_layer("coverage_1_level_2", [18, 100, 129])
+        visible_layers_coverage_1 = [
+            layer_coverage_1,
+            layer_coverage_1_level_1,
+            layer_coverage_1_level2, ]
+
+    frames_1 = {f"coverage_1_level_{level}": with_cell_strings(get_cells_lod_1(h3_resolut_1 + level, view_1))
+                for level in range(len(visible_layers_coverage_1))}
+    return build_payload(
+        pdk.Deck(map_provider='carto', 
+            map_style='light',
+            initial_view_state=pdk.ViewState(
+                latitude=view_1.latitude, longitude=view_1.longitude, zoom=view_1.zoom, height=view_1.height
+            ),
+            tooltip={"html": "<b>ID:</b> {H3}", "style": {"color": "white"}},
+            layers=visible_layers_coverage_1,
+        ),
+        frames_1)
 
-visible_layers_coverage_1 = [layer_coverage_1]
 
-if levels_option == "Two":
-    df_coverage_level_1 = get_h3point_df(h3_resolut_1 + 1, 100000)
-    layer_coverage_1_level_1 = get_coverage_layer(df_coverage_level_1, [217, 102, 255])
-    visible_layers_coverage_1 = [layer_coverage_1, layer_coverage_1_level_1]
+# Each visualisation is a fragment, so a widget change reruns only its own
+# section.
+@fragment
+def visualisation_1():
+    min_v_1, max_v_1, v_1, z_1, lon_1, lat_1 = ( 0, 2, 0, 1, 0.9982847947205775, 2.9819747220001886,)
+    view_1 = View(latitude=lat_1, longitude=lon_1, zoom=z_1, height=400)
+    col1, col2 = st.columns([70, 30])
+    with col1:
+        h3_resolut_1 = st.slider(
+            "H3 resolution", min_value=min_v_1, max_value=max_v_1, value=v_1)
 
-if levels_option == "Three":
-    df_coverage_level_1 = get_h3point_df(h3_resolut_1 + 1, 100000)
-    layer_coverage_1_level_1 = get_coverage_layer(df_coverage_level_1, [217, 102, 255])
+    with col2:
+        levels_option = st.selectbox("Levels", ("One", "Two", "Three"))
 
-    df_coverage_level_2 = get_h3point_df(h3_resolut_1+2, 1000000)
+    st.pydeck_chart(get_deck_1(h3_resolut_1, levels_option, view_1))
 
-    layer_coverage_1_level2 = get_coverage_layer(df_coverage_level_2, [18, 100, 129])
-    visible_layers_coverage_1 = [
-        layer_coverage_1,
-        layer_coverage_1_level_1,
-        layer_coverage_1_level2, ]
 
-st.pydeck_chart(
-    pdk.Deck(map_provider='carto', 
-        map_style='light',
-        initial_view_state=pdk.ViewState(
-            latitude=lat_1, longitude=lon_1, zoom=z_1, height=400
-        ),
-        tooltip={"html": "<b>ID:</b> {H3}", "style": {"color": "white"}},
-        layers=visible_layers_coverage_1,
-    )
-)
+visualisation_1()
 # ------ Visualisation 1 End ---------
 st.divider()
 st.subheader("H3 in Snowflake")
@@ -135,35 +202,25 @@ st.write("""
     Compare the functions' results against the initial (Light Purple) polygon to understand their behavior.""")
 
 
-# ------ Visualisation 2 ---------
-col1, col2, col3 = st.columns(3)
-
-with col1:
-    poly_scale_2 = st.selectbox("Scale of polygon", ("Global", "Local"), index=1)
-    if poly_scale_2 == 'Global':
-        min_v_2, max_v_2, v_2, z_2, lon_2, lat_2 = 2, 5, 4, 2, -94.50284957885742, 38.51405689475766
-    else:
-        min_v_2, max_v_2, v_2, z_2, lon_2, lat_2 = 7, 10, 9, 9, -73.98452997207642, 40.74258515841464
-
-with col2:
-    original_shape_2 = st.selectbox("Show original shape", ("Yes", "No"),  index=0)
-
-with col3:
-    h3_res_2 = st.slider( "H3 resolution ", min_value=min_v_2, max_value=max_v_2, value=v_2)
-
-@st.cache_resource(ttl="2d")
-def get_df_shape_2(poly_scale_2: str) -> pd.DataFrame:
-    df = session.sql(
-        f"select geog from snowpublic.streamlit.h3_polygon_spherical where scale_of_polygon = '{poly_scale_2}'"
-    ).to_pandas()
-    df["coordinates"] = df["GEOG"].apply(lambda row: json.loads(row)["coordinates"][0])
-    return df
+# Independent statements of a cold page run side by side, so it waits for the
+# slowest query rather than the sum of all of them. The Visualisation 2 scale
+# is read from its widget state, which holds the last choice on reruns.
+with st.spinner("Running queries..."):
+    q.get_query_scheduler().run_all([
+        lambda: q.get_df_shape_2(st.session_state.get("poly_scale_2", "Local")),
+        lambda: q.get_cells_2(st.session_state.get("poly_scale_2", "Local")),
+        q.get_cube_3,
+        q.get_cube_4,
+    ])
 
 
-@st.cache_resource(ttl="2d")
-def get_layer_shape_2(df: pd.DataFrame, line_color: List) -> pdk.Layer:
+# ------ Visualisation 2 ---------
+@perf.timed
+def get_layer_shape_2(line_color: List) -> pdk.Layer:
+    import pydeck as pdk
     return pdk.Layer("PolygonLayer", 
-                     df, 
+                     None, 
+                     id="shape_2",
                      opacity=0.9, 
                      stroked=True, 
                      get_polygon="coordinates",
@@ -173,43 +230,12 @@ def get_layer_shape_2(df: pd.DataFrame, line_color: List) -> pdk.Layer:
                      get_line_color=line_color,
                      line_width_min_pixels=1)
 
-@st.cache_resource(ttl="2d")
-def get_df_coverage_2(h3_res_2: float, poly_scale_2: str) -> pd.DataFrame:
-    if poly_scale_2 == 'Global':
-        return session.sql(
-            f"select value::string as h3 from snowpublic.streamlit.h3_polygon_planar, TABLE(FLATTEN(h3_coverage_strings(to_geography('POLYGON((-118.389015198 34.092757508,-73.933868408 40.864977873,-78.47448349 33.898489435,-118.389015198 34.092757508))'), {h3_res_2})))"
-        ).to_pandas()
-    if poly_scale_2 == 'Local':
-        return session.sql(
-            f"select value::string as h3 from snowpublic.streamlit.h3_polygon_planar, TABLE(FLATTEN(h3_coverage_strings(to_geography('POLYGON((-73.819815516 40.783403069,-74.161494076 40.717999437,-73.835597634 40.727238441,-73.819815516 40.783403069))'), {h3_res_2}))) where scale_of_polygon = '{poly_scale_2}'"
-        ).to_pandas()
-
-@st.cache_resource(ttl="2d")
-def get_layer_coverage_2(df_coverage_2: pd.DataFrame, line_color: List) -> pdk.Layer:
-    return pdk.Layer("H3HexagonLayer", 
-                     df_coverage_2, 
-                     get_hexagon="H3", 
-                     extruded=False,
-                     stroked=True, 
-                     filled=False, 
-                     get_line_color=line_color, 
-                     line_width_min_pixels=1)
-
-@st.cache_resource(ttl="2d")
-def get_df_polyfill_2(h3_res_2: float, poly_scale_2: str) -> pd.DataFrame:
-    if poly_scale_2 == 'Global':
-        return session.sql(
-            f"select value::string as h3 from snowpublic.streamlit.h3_polygon_planar, TABLE(FLATTEN(h3_polygon_to_cells_strings(to_geography('POLYGON((-118.389015198 34.092757508,-73.933868408 40.864977873,-78.47448349 33.898489435,-118.389015198 34.092757508))'), {h3_res_2})))"
-        ).to_pandas()
-    if poly_scale_2 == 'Local':
-        return session.sql(
-            f"select value::string as h3 from snowpublic.streamlit.h3_polygon_planar, TABLE(FLATTEN(h3_polygon_to_cells_strings(to_geography('POLYGON((-73.819815516 40.783403069,-74.161494076 40.717999437,-73.835597634 40.727238441,-73.819815516 40.783403069))'), {h3_res_2}))) where scale_of_polygon = '{poly_scale_2}'"
-        ).to_pandas()
-
-@st.cache_resource(ttl="2d")
-def get_layer_polyfill_2(df_polyfill_2: pd.DataFrame, line_color: List) -> pdk.Layer:
+@perf.timed
+def get_layer_cells_2(layer_id: str, line_color: List) -> pdk.Layer:
+    import pydeck as pdk
     return pdk.Layer("H3HexagonLayer", 
-                     df_polyfill_2, 
+                     None, 
+                     id=layer_id,
                      get_hexagon="H3", 
                      extruded=False,
                      stroked=True, 
@@ -217,46 +243,72 @@ def get_layer_polyfill_2(df_polyfill_2: pd.DataFrame, line_color: List) -> pdk.L
                      get_line_color=line_color, 
                      line_width_min_pixels=1)
 
-df_shape_2 = get_df_shape_2(poly_scale_2)
-layer_shape_2 = get_layer_shape_2(df_shape_2, [217, 102, 255])
-
-df_coverage_2 = get_df_coverage_2(h3_res_2, poly_scale_2)
-layer_coverage_2 = get_layer_coverage_2(df_coverage_2, [18, 100, 129])
-
-df_polyfill_2 = get_df_polyfill_2(h3_res_2, poly_scale_2)
-layer_polyfill_2 = get_layer_polyfill_2(df_polyfill_2, [36, 191, 242])
-
-if original_shape_2 == "Yes":
-    visible_layers_coverage_2 = [layer_coverage_2, layer_shape_2]
-    visible_layers_polyfill_2 = [layer_polyfill_2, layer_shape_2]
-else:
-    visible_layers_coverage_2 = [layer_coverage_2]
-    visible_layers_polyfill_2 = [layer_polyfill_2]
-
-col1, col2 = st.columns(2)
-
-with col1:
-    st.pydeck_chart(pdk.Deck(map_provider='carto', map_style='light',
-                             initial_view_state=pdk.ViewState(
-                                 latitude=lat_2,
-                                 longitude=lon_2, 
-                                 zoom=z_2, 
-                                 width = 350, 
-                                 height = 250),
-                             layers=visible_layers_coverage_2))
-    st.caption('H3_COVERAGE')
-
-with col2:
-    st.pydeck_chart(pdk.Deck(map_provider='carto', map_style='light',
-                             initial_view_state=pdk.ViewState(
-                                 latitude=lat_2,
-                                 longitude=lon_2,
-                                 zoom=z_2, 
-                                 width = 350, 
-                                 height = 250),
-                             layers=visible_layers_polyfill_2))
-    st.caption('H3_POLYGON_TO_CELLS')
 
+# One deck per function; the shape data is the same frame in both.
+@cached
+def get_deck_2(function: str, h3_res_2: int, poly_scale_2: str, original_shape_2: str, view_2: View) -> DeckPayload:
+    import pydeck as pdk
+    if function == "h3_coverage":
+        layer_cells_2 = get_layer_cells_2("coverage_2", [18, 100, 129])
+        df_cells_2 = q.get_df_coverage_2(h3_res_2, poly_scale_2)
+    else:
+        layer_cells_2 = get_layer_cells_2("polyfill_2", [36, 191, 242])
+        df_cells_2 = q.get_df_polyfill_2(h3_res_2, poly_scale_2)
+    frames_2 = {layer_cells_2.id: with_cell_strings(df_cells_2)}
+
+    visible_layers_2 = [layer_cells_2]
+    if original_shape_2 == "Yes":
+        visible_layers_2.append(get_layer_shape_2([217, 102, 255]))
+        frames_2["shape_2"] = q.get_df_shape_2(poly_scale_2)[["coordinates"]]
+
+    return build_payload(pdk.Deck(map_provider='carto', map_style='light',
+                                  initial_view_state=pdk.ViewState(
+                                      latitude=view_2.latitude,
+                                      longitude=view_2.longitude, 
+                                      zoom=view_2.zoom, 
+                                      width=view_2.width, 
+                                      height=view_2.height),
+                                  layers=visible_layers_2),
+                         frames_2)
+
+
+@fragment
+def visualisation_2():
+    col1, col2, col3 = st.columns(3)
+
+    with col1:
+        poly_scale_2 = st.selectbox("Scale of polygon", ("Global", "Local"), index=1, key="poly_scale_2")
+        min_v_2, max_v_2 = q.resolutions_2[poly_scale_2]
+        if poly_scale_2 == 'Global':
+            v_2, z_2, lon_2, lat_2 = 4, 2, -94.50284957885742, 38.51405689475766
+        else:
+            v_2, z_2, lon_2, lat_2 = 9, 9, -73.98452997207642, 40.74258515841464
+        view_2 = View(latitude=lat_2, longitude=lon_2, zoom=z_2, width=350, height=250)
+
+    with col2:
+        original_shape_2 = st.selectbox("Show original shape", ("Yes", "No"),  index=0)
+
+    with col3:
+        h3_res_2 = st.slider( "H3 resolution ", min_value=min_v_2, max_value=max_v_2, value=v_2)
+
+    with st.spinner("Running queries..."):
+        q.get_query_scheduler().run_all([
+            lambda: q.get_df_shape_2(poly_scale_2),
+            lambda: q.get_cells_2(poly_scale_2),
+        ])
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.pydeck_chart(get_deck_2("h3_coverage", h3_res_2, poly_scale_2, original_shape_2, view_2))
+        st.caption('H3_COVERAGE')
+
+    with col2:
+        st.pydeck_chart(get_deck_2("h3_polygon_to_cells", h3_res_2, poly_scale_2, original_shape_2, view_2))
+        st.caption('H3_POLYGON_TO_CELLS')
+
+
+visualisation_2()
 # ------ Visualisation 2 End ---------
 st.divider()
 
@@ -283,28 +335,28 @@ st.markdown("These two industries are likely the most active in using the H3 gri
             " Is it Times Square?")
 
 # ------ Visualisation 3 ---------
-@st.cache_resource(ttl="2d")
-def get_df_3(h3_resolut_3: int) -> pd.DataFrame:
-    return session.sql(f'select h3_point_to_cell_string(pickup_location, {h3_resolut_3}) as h3, count(*) as count\n'\
-                       'from snowpublic.streamlit.h3_ny_taxi_rides\n'\
-                       'where 2 = 2\n'\
-                       'group by 1\n').to_pandas()
-@st.cache_resource(ttl="2d")
-def get_quantiles_3(df_column: pd.Series, quantiles: List) -> pd.Series:
-    return df_column.quantile(quantiles)
-
-@st.cache_resource(ttl="2d")
-def get_color_3(df_column: pd.Series, colors: List, vmin: int, vmax: int, index: pd.Series) -> pd.Series:
-    color_map = cm.LinearColormap(colors, vmin=vmin, vmax=vmax, index=index)
-    return df_column.apply(color_map.rgb_bytes_tuple)
-
-@st.cache_resource(ttl="2d")
-def get_layer_3(df: pd.DataFrame) -> pdk.Layer:
+view_3 = View(latitude=40.74258515841464, longitude=-73.98452997207642, zoom=8, pitch=45)
+
+
+# Cut to the deck's view and the hexagon budget; quantiles still come from
+# every cell, so colours do not shift with the view.
+@cached
+def get_df_lod_3(h3_resolut_3: int) -> pd.DataFrame:
+    return limit_hexagons(q.get_df_3(h3_resolut_3), view_3, hexagon_budget, "COUNT", min_resolution=6)
+
+@cached
+def get_quantiles_3(h3_resolut_3: int, style_option_t_3: str) -> pd.Series:
+    return q.get_df_3(h3_resolut_3)["COUNT"].quantile(COLOR_SCHEMES[style_option_t_3].quantiles)
+
+@perf.timed
+def get_layer_3() -> pdk.Layer:
+    import pydeck as pdk
     return pdk.Layer("H3HexagonLayer", 
-                     df, 
+                     None, 
+                     id="pickups_3",
                      get_hexagon="H3",
-                     get_fill_color="COLOR", 
-                     get_line_color="COLOR",
+                     get_fill_color=PACKED_COLOR, 
+                     get_line_color=PACKED_COLOR,
                      get_elevation="COUNT/50000",
                      auto_highlight=True,
                      elevation_scale=50,
@@ -313,44 +365,46 @@ def get_layer_3(df: pd.DataFrame) -> pdk.Layer:
                      extruded=True,
                      coverage=1,
                      opacity=0.3)
-   
-col1, col2 = st.columns(2)
-with col1:
-    h3_resolut_3 = st.slider(
-        "H3 resolution  ",
-        min_value=6, max_value=9, value=7)
 
-with col2:
-    style_option_t_3 = st.selectbox("Style schema ",
-                                ("Contrast", "Snowflake"), 
-                                index=0)
-
-df_3 = get_df_3(h3_resolut_3)
-
-if style_option_t_3 == "Contrast":
-    quantiles_3 = get_quantiles_3(df_3["COUNT"], [0, 0.25, 0.5, 0.75, 1])
-    colors_3 = ['gray','blue','green','yellow','orange','red']
-    st.image('./img/gradient_c.png')
-if style_option_t_3 == "Snowflake":
-    quantiles_3 = get_quantiles_3(df_3["COUNT"], [0, 0.33, 0.66, 1])
-    colors_3 = ['#666666', '#24BFF2', '#126481', '#D966FF']
-    st.image('./img/gradient_sf.jpg')
-
-df_3['COLOR'] = get_color_3(df_3['COUNT'], colors_3, quantiles_3.min(), quantiles_3.max(), quantiles_3)
-layer_3 = get_layer_3(df_3)
-
-st.pydeck_chart(pdk.Deck(map_provider='carto',  map_style='light',
-    initial_view_state=pdk.ViewState(
-        latitude=40.74258515841464,
-        longitude=-73.98452997207642, pitch=45, zoom=8),
-        tooltip={
-            'html': '<b>Pickups:</b> {COUNT}',
-             'style': {
-                 'color': 'white'
-                 }
-            },
-    layers=[layer_3]))
 
+@cached
+def get_deck_3(h3_resolut_3: int, style_option_t_3: str) -> DeckPayload:
+    import pydeck as pdk
+    df_3 = with_colors(get_df_lod_3(h3_resolut_3), COLOR_SCHEMES[style_option_t_3].colors, get_quantiles_3(h3_resolut_3, style_option_t_3))
+    layer_3 = get_layer_3()
+
+    return build_payload(pdk.Deck(map_provider='carto',  map_style='light',
+        initial_view_state=pdk.ViewState(
+            latitude=view_3.latitude,
+            longitude=view_3.longitude, pitch=view_3.pitch, zoom=view_3.zoom),
+            tooltip={
+                'html': '<b>Pickups:</b> {COUNT}',
+                 'style': {
+                     'color': 'white'
+                     }
+                },
+        layers=[layer_3]),
+        {"pickups_3": with_cell_strings(df_3)[["H3", "COUNT", "COLOR"]]})
+
+
+@fragment
+def visualisation_3():
+    col1, col2 = st.columns(2)
+    with col1:
+        h3_resolut_3 = st.slider(
+            "H3 resolution  ",
+            min_value=6, max_value=q.max_resolution_3, value=7)
+
+    with col2:
+        style_option_t_3 = st.selectbox("Style schema ",
+                                    tuple(COLOR_SCHEMES), 
+                                    index=0)
+
+    st.image(COLOR_SCHEMES[style_option_t_3].legend)
+    st.pydeck_chart(get_deck_3(h3_resolut_3, style_option_t_3))
+
+
+visualisation_3()
 # ------ Visualisation 3 End ---------
 
 st.divider()
@@ -366,29 +420,28 @@ st.write(
 
 
 # ------ Visualisation 4 ---------
-@st.cache_resource(ttl="2d")
-def get_df_4(resolution: int) -> pd.DataFrame:
-    return session.sql(f'select h3_latlng_to_cell_string(lat, lon, {resolution}) as h3, count(*) as count\n'\
-                       'from OPENCELLID.PUBLIC.RAW_CELL_TOWERS\n'\
-                        'where mcc between 310 and 316\n'\
-                            'group by 1').to_pandas()
-
-@st.cache_resource(ttl="2d")
-def get_quantiles_4(df_column: pd.Series, quantiles: List) -> pd.Series:
-    return df_column.quantile(quantiles)
-
-@st.cache_resource(ttl="2d")
-def get_color_4(df_column: pd.Series, colors: List, vmin: int, vmax: int, index: pd.Series) -> pd.Series:
-    color_map = cm.LinearColormap(colors, vmin=vmin, vmax=vmax, index=index)
-    return df_column.apply(color_map.rgb_bytes_tuple)
-
-@st.cache_resource(ttl="2d")
-def get_layer_4(df: pd.DataFrame) -> pdk.Layer:
+view_4 = View(latitude=38.51405689475766, longitude=-96.50284957885742, zoom=3)
+
+
+# Cut to the deck's view and the hexagon budget; quantiles still come from
+# every cell, so colours do not shift with the view.
+@cached
+def get_df_lod_4(h3_resolution_4: int) -> pd.DataFrame:
+    return limit_hexagons(q.get_df_4(h3_resolution_4), view_4, hexagon_budget, "COUNT", min_resolution=2)
+
+@cached
+def get_quantiles_4(h3_resolution_4: int, style_option_4: str) -> pd.Series:
+    return q.get_df_4(h3_resolution_4)["COUNT"].quantile(COLOR_SCHEMES[style_option_4].quantiles)
+
+@perf.timed
+def get_layer_4() -> pdk.Layer:
+    import pydeck as pdk
     return pdk.Layer("H3HexagonLayer", 
-                     df, 
+                     None, 
+                     id="towers_4",
                      get_hexagon="H3",
-                     get_fill_color="COLOR", 
-                     get_line_color="COLOR",
+                     get_fill_color=PACKED_COLOR, 
+                     get_line_color=PACKED_COLOR,
                      get_elevation="COUNT",
                      auto_highlight=True,
                      elevation_scale=50,
@@ -397,41 +450,43 @@ def get_layer_4(df: pd.DataFrame) -> pdk.Layer:
                      extruded=False,
                      coverage=1,
                      opacity=0.5)
-    
-col1, col2 = st.columns(2)
 
-with col1:
-    h3_resolution_4 = st.slider("H3 resolution     ", min_value=2, max_value=7, value=2)
 
-with col2:
-    style_option_4 = st.selectbox("Style schema     ", ("Contrast", "Snowflake"), index=0)
-
-df_4 = get_df_4(h3_resolution_4)
-
-if style_option_4 == "Contrast":
-    quantiles_4 = get_quantiles_4(df_4["COUNT"], [0, 0.25, 0.5, 0.75, 1])
-    colors_4 = ['gray','blue','green','yellow','orange','red']
-    st.image('./img/gradient_c.png')
-if style_option_4 == "Snowflake":
-    quantiles_4 = get_quantiles_4(df_4["COUNT"], [0, 0.33, 0.66, 1])
-    colors_4 = ['#666666', '#24BFF2', '#126481', '#D966FF']
-    st.image('./img/gradient_sf.jpg')
-
-df_4['COLOR'] = get_color_4(df_4['COUNT'], colors_4, quantiles_4.min(), quantiles_4.max(), quantiles_4)
-layer_4 = get_layer_4(df_4)
-
-st.pydeck_chart(pdk.Deck(map_provider='carto', map_style='light',
-    initial_view_state=pdk.ViewState(
-        latitude=38.51405689475766,
-        longitude=-96.50284957885742, zoom=3),
-                         tooltip={
-        'html': '<b>Cell towers:</b> {COUNT}',
-        'style': {
-            'color': 'white'
-        }
-    },
-    layers=[layer_4]))
+@cached
+def get_deck_4(h3_resolution_4: int, style_option_4: str) -> DeckPayload:
+    import pydeck as pdk
+    df_4 = with_colors(get_df_lod_4(h3_resolution_4), COLOR_SCHEMES[style_option_4].colors, get_quantiles_4(h3_resolution_4, style_option_4))
+    layer_4 = get_layer_4()
+
+    return build_payload(pdk.Deck(map_provider='carto', map_style='light',
+        initial_view_state=pdk.ViewState(
+            latitude=view_4.latitude,
+            longitude=view_4.longitude, zoom=view_4.zoom),
+                             tooltip={
+            'html': '<b>Cell towers:</b> {COUNT}',
+            'style': {
+                'color': 'white'
+            }
+        },
+        layers=[layer_4]),
+        {"towers_4": with_cell_strings(df_4)[["H3", "COUNT", "COLOR"]]})
+
+
+@fragment
+def visualisation_4():
+    col1, col2 = st.columns(2)
 
+    with col1:
+        h3_resolution_4 = st.slider("H3 resolution     ", min_value=2, max_value=q.max_resolution_4, value=2)
+
+    with col2:
+        style_option_4 = st.selectbox("Style schema     ", tuple(COLOR_SCHEMES), index=0)
+
+    st.image(COLOR_SCHEMES[style_option_4].legend)
+    st.pydeck_chart(get_deck_4(h3_resolution_4, style_option_4))
+
+
+visualisation_4()
 # ------ Visualisation 6 End ---------
 st.divider()
 st.markdown("The world of geospatial data is vast and complex, but with tools like H3, it becomes more accessible and manageable. "
@@ -444,3 +499,7 @@ col1, col2, col_3 = st.columns(3)
 with col2:
     st.image('https://sfquickstarts-obielov.s3.us-west-2.amazonaws.com/streamlit/snowflake_h3.jpg', 
          width=173)
+
+rerun = perf.end_rerun(perf_settings.get("log_file"))
+if rerun is not None and "perf" in st.query_params:
+    perf.show_panel(rerun, q.get_result_cache().stats())
@@ -0,0 +1,173 @@
+"""Timings, fetches and cache use of each rerun.
+
+Recording is off unless a rerun calls ``begin_rerun``; until then a timed
+function costs one dict check. Records are kept per Streamlit session, so
+work done by query scheduler threads counts towards the rerun that
+submitted it. Background cache refreshes belong to no rerun and are not
+recorded.
+"""
+import functools
+import json
+import logging
+import threading
+import time
+from collections import Counter, deque
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Rerun:
+    session_id: str
+    started_at: float = field(default_factory=time.time)
+    seconds: Optional[float] = None
+    timings: List[Tuple[str, float]] = field(default_factory=list)
+    fetches: List[Any] = field(default_factory=list)
+    counts: Counter = field(default_factory=Counter)
+    started: float = field(default_factory=time.perf_counter, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def functions(self) -> Dict[str, Dict[str, float]]:
+        """Calls, total and slowest seconds per timed function."""
+        totals: Dict[str, Dict[str, float]] = {}
+        for name, seconds in self.timings:
+            stats = totals.setdefault(name, {"calls": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+            stats["calls"] += 1
+            stats["total_seconds"] += seconds
+            stats["max_seconds"] = max(stats["max_seconds"], seconds)
+        return totals
+
+    def to_dict(self) -> Dict[str, Any]:
+        fetches = [{name: value for name, value in asdict(fetch).items() if name != "started"} for fetch in self.fetches]
+        return {"session_id": self.session_id, "started_at": self.started_at, "seconds": self.seconds,
+                "functions": self.functions(), "fetches": fetches,
+                "cache": {"hits": self.counts["cache_lookups"] - self.counts["cache_misses"],
+                          "misses": self.counts["cache_misses"]},
+                "result_store_hits": self.counts["result_store_hits"]}
+
+
+# Reruns being recorded, by session id.
+_reruns: Dict[str, Rerun] = {}
+# A rerun that has not ended after this long was abandoned, by an error or
+# a widget change, and is no longer recorded.
+_MAX_RERUN_SECONDS = 600.0
+# Most recent finished reruns of this process, newest last.
+recent_reruns: Deque[Rerun] = deque(maxlen=100)
+_file_lock = threading.Lock()
+
+
+def current() -> Optional[Rerun]:
+    if not _reruns:
+        return None
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    ctx = get_script_run_ctx(suppress_warning=True)
+    rerun = None if ctx is None else _reruns.get(ctx.session_id)
+    if rerun is None:
+        _drop_abandoned()
+    return rerun
+
+
+def _drop_abandoned() -> None:
+    # Otherwise one abandoned rerun would keep every session off the fast path.
+    from streamlit import runtime
+    now = time.perf_counter()
+    for session_id, rerun in list(_reruns.items()):
+        closed = runtime.exists() and not runtime.get_instance().is_active_session(session_id)
+        if closed or now - rerun.started > _MAX_RERUN_SECONDS:
+            _reruns.pop(session_id, None)
+
+
+def begin_rerun() -> None:
+    """Record the current session's rerun until ``end_rerun``.
+
+    A rerun that stops early, for a widget change or an error, is replaced
+    by the session's next one, or dropped once its session has closed or
+    ``_MAX_RERUN_SECONDS`` have passed.
+    """
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    _drop_abandoned()
+    ctx = get_script_run_ctx(suppress_warning=True)
+    if ctx is not None:
+        _reruns[ctx.session_id] = Rerun(ctx.session_id)
+
+
+def end_rerun(log_file: Optional[str] = None) -> Optional[Rerun]:
+    """Finish the current session's rerun and log it as one JSON line.
+
+    With ``log_file`` the line is also appended there, for load tests.
+    """
+    rerun = current()
+    if rerun is None:
+        return None
+    _reruns.pop(rerun.session_id, None)
+    rerun.seconds = time.perf_counter() - rerun.started
+    recent_reruns.append(rerun)
+    line = json.dumps(rerun.to_dict())
+    logger.info("%s", line)
+    if log_file:
+        with _file_lock, open(log_file, "a") as f:
+            f.write(line + "\n")
+    return rerun
+
+
+def record(name: str, seconds: float) -> None:
+    rerun = current()
+    if rerun is not None:
+        with rerun._lock:
+            rerun.timings.append((name, seconds))
+
+
+def count(name: str, n: int = 1) -> None:
+    rerun = current()
+    if rerun is not None:
+        with rerun._lock:
+            rerun.counts[name] += n
+
+
+def add_fetch(stats: Any) -> None:
+    rerun = current()
+    if rerun is not None:
+        with rerun._lock:
+            rerun.fetches.append(stats)
+
+
+def timed(func: Callable) -> Callable:
+    """Record the wall time of every call of ``func`` under its qualified name."""
+    name = func.__qualname__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _reruns:
+            return func(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            record(name, time.perf_counter() - started)
+    return wrapper
+
+
+def show_panel(rerun: Rerun, cache_stats: Dict[str, Any]) -> None:
+    import pandas as pd
+    import streamlit as st
+
+    summary = rerun.to_dict()
+    with st.sidebar:
+        st.subheader("Performance")
+        col1, col2 = st.columns(2)
+        col1.metric("Rerun", f"{rerun.seconds:.2f}s")
+        col2.metric("Queries", len(rerun.fetches))
+        col1.metric("Cache hits", summary["cache"]["hits"])
+        col2.metric("Cache misses", summary["cache"]["misses"])
+        functions = pd.DataFrame.from_dict(summary["functions"], orient="index")
+        if not functions.empty:
+            st.dataframe(functions.sort_values("total_seconds", ascending=False))
+        if summary["fetches"]:
+            st.dataframe(pd.DataFrame(summary["fetches"])[["query_id", "rows", "bytes", "seconds", "query"]])
+        st.caption(f"{summary['result_store_hits']} results read from the result store")
+        st.json(cache_stats, expanded=False)
+        history = [r.to_dict() for r in recent_reruns if r.session_id == rerun.session_id]
+        st.download_button("Download JSON", "\n".join(json.dumps(r) for r in history),
+                           file_name="perf.jsonl", mime="application/json")
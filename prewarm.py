@@ -0,0 +1,75 @@
+"""Fill the result store with every query the app can issue.
+
+Run it from the app directory, with the same .streamlit/secrets.toml, before
+starting a new process or replica:
+
+    python prewarm.py            # fetch what the store lacks or holds for over max_age
+    python prewarm.py --refresh  # fetch everything again
+
+Every slider and selectbox position of main.py is served from these
+results: Visualisation 2 fetches each scale's whole resolution range at
+once, and Visualisations 3 and 4 roll their count cubes up locally.
+"""
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List
+
+import pyarrow as pa
+import streamlit as st
+
+import queries as q
+from data_access import iter_arrow_batches, table_from_batches
+from result_store import ResultStore
+from session_pool import SessionPool
+
+
+def prewarm_queries() -> List[str]:
+    queries = []
+    if q.get_h3_engine() != "local":
+        queries += [q.shape_query_2(scale) for scale in q.polygons_2]
+        queries += [q.cells_query_2(scale) for scale in q.polygons_2]
+    return queries
+
+
+def prewarm_cube(source: q.CubeSource, prewarm: Callable[[str], pa.Table]) -> None:
+    # With a watermark column the app loads the cube up to the stored
+    # watermark, so that statement is the one to keep.
+    column = q.get_watermark_column(source)
+    if column is None:
+        prewarm(source.query(source.condition))
+        return
+    watermark = prewarm(q.watermark_query(source, column)).column("WATERMARK")[0].as_py()
+    prewarm(source.query(source.condition) if watermark is None else q.bounded_query(source, column, watermark))
+
+
+def main(refresh: bool = False) -> None:
+    # Built here rather than through the st.cache_resource getters, which
+    # do not cache outside `streamlit run`.
+    store = ResultStore(**q.result_store_settings())
+    if refresh:
+        store.max_age = 0
+    pool = SessionPool(q.create_session, **st.secrets.get("session_pool", {}))
+
+    def prewarm(query: str) -> pa.Table:
+        table = store.get(query)
+        if table is None:
+            table = pool.run(lambda session: table_from_batches(store.write_through(query, iter_arrow_batches(session, query))))
+        return table
+
+    queries = prewarm_queries()
+    started = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=pool.capacity) as executor:
+            futures = [executor.submit(prewarm, query) for query in queries]
+            futures += [executor.submit(prewarm_cube, source, prewarm) for source in (q.cube_3, q.cube_4)]
+            for future in futures:
+                future.result()
+    finally:
+        pool.close()
+    print(f"{store.hits + store.misses} results ready in {store.directory} after {time.perf_counter() - started:.1f}s "
+          f"({store.hits} already stored, {store.misses} fetched)")
+
+
+if __name__ == "__main__":
+    main(refresh="--refresh" in sys.argv[1:])
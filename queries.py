@@ -0,0 +1,263 @@
+"""Data functions behind the visualisations.
+
+Kept apart from main.py so sections can share them without importing each
+other. Nothing here imports Snowpark until the first query.
+"""
+import json
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple, TypeVar
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import streamlit as st
+
+import perf
+from count_cube import CountCube
+from data_access import cells_by_from_batches, cells_from_batches, iter_arrow_batches, pandas_from_batches
+from query_scheduler import QueryScheduler
+from result_cache import DEFAULT_TTL, ResultCache, memoize, refreshing
+from result_store import ResultStore
+from session_pool import SessionPool
+
+T = TypeVar("T")
+
+
+def create_session():
+    # A [replay] section answers every query from recorded results instead,
+    # for benchmarks and offline runs; see replay_session.py.
+    if "replay" in st.secrets:
+        from replay_session import ReplaySession
+        return ReplaySession(**st.secrets["replay"])
+    from snowflake.snowpark import Session
+    return Session.builder.configs(st.secrets["geodemo"]).create()
+
+
+# One pool per process, shared by every query function. Optional settings
+# (max_sessions, health_check_interval, keep_alive_interval, ...) are read
+# from the [session_pool] section of secrets.toml.
+@st.cache_resource
+def get_session_pool() -> SessionPool:
+    return SessionPool(create_session, **st.secrets.get("session_pool", {}))
+
+
+@st.cache_resource
+def get_query_scheduler() -> QueryScheduler:
+    return QueryScheduler(max_workers=get_session_pool().capacity)
+
+
+# Results and layers share one byte-bounded cache per process. Its budget
+# (max_bytes), entry lifetime (ttl, in seconds) and the wait after a failed
+# refresh (retry_after, in seconds) can be set in the [result_cache] section
+# of secrets.toml.
+@st.cache_resource
+def get_result_cache() -> ResultCache:
+    return ResultCache(**st.secrets.get("result_cache", {}))
+
+
+cached = memoize(get_result_cache)
+
+
+# Query results persist across restarts in an on-disk store, filled by
+# prewarm.py or by the first run of each query. Its directory and max_age
+# (seconds) can be set in the [result_store] section of secrets.toml.
+def result_store_settings() -> dict:
+    # A stored result starts a new cache entry with a full ttl, so by default
+    # it is only read back while younger than that ttl; older ones are
+    # fetched again, by the app or by prewarm.py.
+    settings = dict(st.secrets.get("result_store", {}))
+    settings.setdefault("max_age", st.secrets.get("result_cache", {}).get("ttl", DEFAULT_TTL))
+    return settings
+
+
+@st.cache_resource
+def get_result_store() -> ResultStore:
+    return ResultStore(**result_store_settings())
+
+
+def run_batches(query: str, consume: Callable[[Iterable[pa.RecordBatch]], T], persist: bool = True) -> T:
+    """``consume`` the result batches of ``query``, from the store when it has them.
+
+    Cache refreshes always go to Snowflake. Results with ``persist=False``,
+    such as one-off increments, are neither read from nor written to the store.
+    """
+    store = get_result_store()
+    if persist and not refreshing():
+        table = store.get(query)
+        if table is not None:
+            perf.count("result_store_hits")
+            return consume(table.to_batches())
+    if not persist:
+        return get_session_pool().run(lambda session: consume(iter_arrow_batches(session, query)))
+    return get_session_pool().run(
+        lambda session: consume(store.write_through(query, iter_arrow_batches(session, query))))
+
+
+def run_sql(query: str) -> pd.DataFrame:
+    return run_batches(query, pandas_from_batches)
+
+
+def run_sql_cells(query: str) -> pd.DataFrame:
+    return run_batches(query, lambda batches: pd.DataFrame({"H3": cells_from_batches(batches)}))
+
+
+def run_sql_cells_by(query: str, keys: List[str]) -> Dict[Tuple[int, ...], np.ndarray]:
+    return run_batches(query, lambda batches: cells_by_from_batches(batches, keys))
+
+
+def run_sql_cube(query: str, resolution: int, persist: bool = True) -> CountCube:
+    return run_batches(query, lambda batches: CountCube.from_batches(batches, resolution), persist)
+
+
+class CubeSource(NamedTuple):
+    name: str
+    query: Callable[[str], str]
+    table: str
+    condition: str
+    resolution: int
+
+
+def get_watermark_column(source: CubeSource) -> Optional[str]:
+    # Append-only sources can be refreshed incrementally by naming a
+    # monotonically increasing column, e.g. [incremental] cube_4 = "created".
+    return st.secrets.get("incremental", {}).get(source.name)
+
+
+def watermark_query(source: CubeSource, column: str) -> str:
+    return f"select max({column})::varchar as watermark from {source.table} where {source.condition}"
+
+
+def bounded_query(source: CubeSource, column: str, watermark: str, since: Optional[str] = None) -> str:
+    condition = f"{source.condition} and {column} <= '{watermark}'"
+    if since is not None:
+        condition += f" and {column} > '{since}'"
+    return source.query(condition)
+
+
+def load_cube(source: CubeSource, previous: Optional[CountCube] = None) -> CountCube:
+    """Count cube of ``source``, adding only newer rows to ``previous`` when it has a watermark."""
+    column = get_watermark_column(source)
+    if column is None:
+        return run_sql_cube(source.query(source.condition), source.resolution)
+    watermark = run_sql(watermark_query(source, column))["WATERMARK"].iloc[0]
+    if watermark is None:
+        return run_sql_cube(source.query(source.condition), source.resolution)
+    if previous is None or previous.watermark is None:
+        cube = run_sql_cube(bounded_query(source, column, watermark), source.resolution)
+        cube.watermark = watermark
+        return cube
+    if watermark == previous.watermark:
+        return CountCube(previous.cells, previous.counts, source.resolution, watermark)
+    added = run_sql_cube(bounded_query(source, column, watermark, previous.watermark), source.resolution, persist=False)
+    return previous.merge(added, watermark)
+
+
+def get_h3_engine() -> str:
+    # "snowflake" runs the Visualisation 2 comparison in the warehouse;
+    # "local" serves it from h3_local with no warehouse round trip.
+    return st.secrets.get("h3_engine", "snowflake")
+
+
+# ------ Visualisation 2 ---------
+resolutions_2 = {'Global': (2, 5), 'Local': (7, 10)}
+polygons_2 = {
+    'Global': 'POLYGON((-118.389015198 34.092757508,-73.933868408 40.864977873,-78.47448349 33.898489435,-118.389015198 34.092757508))',
+    'Local': 'POLYGON((-73.819815516 40.783403069,-74.161494076 40.717999437,-73.835597634 40.727238441,-73.819815516 40.783403069))',
+}
+functions_2 = ("h3_coverage", "h3_polygon_to_cells")
+
+
+def shape_query_2(poly_scale_2: str) -> str:
+    return f"select geog from snowpublic.streamlit.h3_polygon_spherical where scale_of_polygon = '{poly_scale_2}'"
+
+
+# Coverage and polyfill for the whole slider range of a scale come back in a
+# single statement, tagged by function and resolution; slider moves are local.
+def cells_query_2(poly_scale_2: str) -> str:
+    min_res, max_res = resolutions_2[poly_scale_2]
+    return "\nunion all\n".join(
+        f"select {fn} as fn, r.value::int as res, c.value::bigint as h3 "
+        f"from table(flatten(array_generate_range({min_res}, {max_res + 1}))) r, "
+        f"lateral flatten(input => {function}(to_geography('{polygons_2[poly_scale_2]}'), r.value::int)) c"
+        for fn, function in enumerate(functions_2))
+
+
+@cached
+def get_df_shape_2(poly_scale_2: str) -> pd.DataFrame:
+    if get_h3_engine() == "local":
+        from h3_local import spherical_outline
+        return pd.DataFrame({"coordinates": [spherical_outline(polygons_2[poly_scale_2])]})
+    df = run_sql(shape_query_2(poly_scale_2))
+    df["coordinates"] = df["GEOG"].apply(lambda row: json.loads(row)["coordinates"][0])
+    return df
+
+
+@cached
+def get_cells_2(poly_scale_2: str) -> Dict[Tuple[int, ...], np.ndarray]:
+    if get_h3_engine() == "local":
+        from h3_local import cells_for_range
+        return cells_for_range(polygons_2[poly_scale_2], *resolutions_2[poly_scale_2])
+    return run_sql_cells_by(cells_query_2(poly_scale_2), ["FN", "RES"])
+
+
+@cached
+def get_df_coverage_2(h3_res_2: int, poly_scale_2: str) -> pd.DataFrame:
+    cells = get_cells_2(poly_scale_2).get((functions_2.index("h3_coverage"), h3_res_2))
+    return pd.DataFrame({"H3": cells if cells is not None else np.empty(0, dtype=np.uint64)})
+
+
+@cached
+def get_df_polyfill_2(h3_res_2: int, poly_scale_2: str) -> pd.DataFrame:
+    cells = get_cells_2(poly_scale_2).get((functions_2.index("h3_polygon_to_cells"), h3_res_2))
+    return pd.DataFrame({"H3": cells if cells is not None else np.empty(0, dtype=np.uint64)})
+
+
+# ------ Visualisation 3 ---------
+max_resolution_3 = 9
+table_3 = 'snowpublic.streamlit.h3_ny_taxi_rides'
+
+
+def cube_query_3(condition: str = '2 = 2') -> str:
+    return (f'select h3_point_to_cell(pickup_location, {max_resolution_3}) as h3, count(*) as count\n'\
+            f'from {table_3}\n'\
+            f'where {condition}\n'\
+            'group by 1\n')
+
+
+cube_3 = CubeSource("cube_3", cube_query_3, table_3, '2 = 2', max_resolution_3)
+
+
+# An expired cube stays on screen while one background refresh reloads it,
+# or only adds the rows past its watermark when [incremental] names a column.
+@cached(update=lambda previous: load_cube(cube_3, previous))
+def get_cube_3() -> CountCube:
+    return load_cube(cube_3)
+
+
+@cached
+def get_df_3(h3_resolut_3: int) -> pd.DataFrame:
+    return get_cube_3().at(h3_resolut_3)
+
+
+# ------ Visualisation 4 ---------
+max_resolution_4 = 7
+table_4 = 'OPENCELLID.PUBLIC.RAW_CELL_TOWERS'
+
+
+def cube_query_4(condition: str = 'mcc between 310 and 316') -> str:
+    return (f'select h3_latlng_to_cell(lat, lon, {max_resolution_4}) as h3, count(*) as count\n'\
+            f'from {table_4}\n'\
+            f'where {condition}\n'\
+            'group by 1')
+
+
+cube_4 = CubeSource("cube_4", cube_query_4, table_4, 'mcc between 310 and 316', max_resolution_4)
+
+
+@cached(update=lambda previous: load_cube(cube_4, previous))
+def get_cube_4() -> CountCube:
+    return load_cube(cube_4)
+
+
+@cached
+def get_df_4(resolution: int) -> pd.DataFrame:
+    return get_cube_4().at(resolution)
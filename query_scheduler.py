@@ -0,0 +1,35 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Sequence
+
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+
+class QueryScheduler:
+    """Runs independent data functions of a rerun side by side.
+
+    The calls are usually cached data functions, so running them here fills
+    the same caches the page reads afterwards. ``max_workers`` should match
+    the session pool's capacity; the pool itself enforces the per-session
+    limit on statements in flight.
+    """
+
+    def __init__(self, max_workers: int):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="snowflake-query")
+
+    def run_all(self, calls: Sequence[Callable[[], Any]]) -> List[Any]:
+        ctx = get_script_run_ctx()
+        futures = [self._executor.submit(_run_with_ctx, ctx, call) for call in calls]
+        # Wait for every call before raising, so no query outlives the rerun.
+        errors = [future.exception() for future in futures]
+        for error in errors:
+            if error is not None:
+                raise error
+        return [future.result() for future in futures]
+
+
+def _run_with_ctx(ctx: Any, call: Callable[[], Any]) -> Any:
+    # Workers are reused across reruns and sessions; every task attaches the
+    # context of the rerun that submitted it.
+    add_script_run_ctx(threading.current_thread(), ctx)
+    return call()
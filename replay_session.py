@@ -0,0 +1,52 @@
+"""Stand-in for a Snowpark Session that answers from recorded results.
+
+Fixtures are a result store directory: one Arrow IPC file per normalized
+query. Record them against a live account by running prewarm.py with the
+[result_store] directory pointed at the fixture directory, then replay with
+
+    [replay]
+    fixtures = "bench/fixtures"
+    latency = 0.5  # seconds per statement, optional
+"""
+import os
+import time
+from typing import Any, Dict, List
+
+import pandas as pd
+
+from result_store import ResultStore, normalize_query
+from session_pool import HEALTH_CHECK_SQL
+
+
+class ReplaySession:
+    def __init__(self, fixtures: str, latency: float = 0.0):
+        if not os.path.isdir(fixtures):
+            raise FileNotFoundError(f"No fixture directory at {fixtures!r}")
+        self.store = ResultStore(fixtures)
+        self.latency = latency
+        self.statements = 0
+
+    def sql(self, query: str) -> "ReplayDataFrame":
+        return ReplayDataFrame(self, query)
+
+    def close(self) -> None:
+        pass
+
+
+class ReplayDataFrame:
+    def __init__(self, session: ReplaySession, query: str):
+        self._session = session
+        self._query = query
+
+    def to_pandas(self) -> pd.DataFrame:
+        self._session.statements += 1
+        time.sleep(self._session.latency)
+        if normalize_query(self._query) == HEALTH_CHECK_SQL:
+            return pd.DataFrame({"1": [1]})
+        table = self._session.store.get(self._query)
+        if table is None:
+            raise LookupError(f"No recorded result at {self._session.store.path(self._query)} for:\n{self._query}")
+        return table.to_pandas()
+
+    def collect(self) -> List[Dict[str, Any]]:
+        return self.to_pandas().to_dict(orient="records")
@@ -0,0 +1,263 @@
+import functools
+import logging
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+import perf
+
+logger = logging.getLogger(__name__)
+
+# Containers longer than this are sized from an evenly spaced sample.
+_SAMPLE_SIZE = 32
+
+_refreshing: ContextVar[bool] = ContextVar("refreshing", default=False)
+
+
+def refreshing() -> bool:
+    """Whether the caller runs inside a background refresh.
+
+    Data sources should then skip their own persisted copies, which are at
+    least as old as the entry being refreshed.
+    """
+    return _refreshing.get()
+
+
+@dataclass
+class CacheEntry:
+    value: Any
+    nbytes: int
+    expires_at: float
+
+
+# Seconds an entry is served before it is refreshed.
+DEFAULT_TTL = 2 * 24 * 3600.0
+
+
+class ResultCache:
+    """Least recently used cache of query results and layers, bounded in bytes.
+
+    Entries are keyed by the parameters that produced them, such as
+    resolution, scale and style, so a lookup never hashes the data itself.
+    When a new entry pushes the total over ``max_bytes``, the least recently
+    used entries are evicted first. A value bigger than the whole budget is
+    returned but not kept.
+
+    An entry older than ``ttl`` is still served while a single background
+    thread recomputes it, or updates it from the stale value when an
+    ``update`` function is given. After a failed refresh the stale value is
+    served without retrying for ``retry_after`` seconds. Concurrent misses
+    on one key share one computation.
+    """
+
+    def __init__(self, max_bytes: int = 512 * 1024 ** 2, ttl: Optional[float] = DEFAULT_TTL,
+                 retry_after: float = 300.0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.retry_after = retry_after
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale_hits = 0
+        self.coalesced = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self.last_refresh_seconds: Optional[float] = None
+        self._entries: "OrderedDict[Hashable, CacheEntry]" = OrderedDict()
+        self._in_flight: Dict[Hashable, Future] = {}
+        self._failed_at: Dict[Hashable, float] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any],
+                       update: Optional[Callable[[Any], Any]] = None) -> Any:
+        stale = None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                now = time.monotonic()
+                if entry.expires_at > now:
+                    self.hits += 1
+                    return entry.value
+                # A refresh brings its stale dependencies up to date in place,
+                # so it never builds on another stale value.
+                if not refreshing():
+                    self.stale_hits += 1
+                    backing_off = now < self._failed_at.get(key, float("-inf")) + self.retry_after
+                    if key not in self._in_flight and not backing_off:
+                        future = self._in_flight[key] = Future()
+                        threading.Thread(target=self._refresh_in_background,
+                                         args=(key, compute, update, entry.value, future),
+                                         name="cache-refresh", daemon=True).start()
+                    return entry.value
+                stale = entry
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                owner = False
+            else:
+                if stale is None:
+                    self.misses += 1
+                future = self._in_flight[key] = Future()
+                owner = True
+        if not owner:
+            return future.result()
+        if stale is not None:
+            return self._refresh(key, compute, update, stale.value, future)
+        try:
+            value = compute()
+        except BaseException as error:
+            self._settle(key, future, error=error)
+            raise
+        self._settle(key, future, value=value)
+        return value
+
+    def _refresh(self, key: Hashable, compute: Callable[[], Any], update: Optional[Callable[[Any], Any]],
+                 stale: Any, future: Future) -> Any:
+        token = _refreshing.set(True)
+        started = time.perf_counter()
+        try:
+            value = update(stale) if update is not None else compute()
+        except BaseException as error:
+            with self._lock:
+                self.refresh_failures += 1
+                self._failed_at[key] = time.monotonic()
+            self._settle(key, future, error=error)
+            raise
+        finally:
+            _refreshing.reset(token)
+        seconds = time.perf_counter() - started
+        with self._lock:
+            self.refreshes += 1
+            self.last_refresh_seconds = seconds
+            self._failed_at.pop(key, None)
+        logger.info("refreshed %r in %.3fs", key, seconds)
+        self._settle(key, future, value=value)
+        return value
+
+    def _refresh_in_background(self, key: Hashable, *args: Any) -> None:
+        try:
+            self._refresh(key, *args)
+        except Exception:
+            logger.exception("refreshing %r failed, serving the stale value for %gs", key, self.retry_after)
+
+    def _settle(self, key: Hashable, future: Future, value: Any = None,
+                error: Optional[BaseException] = None) -> None:
+        # The entry is stored before the key leaves _in_flight, so no reader
+        # finds neither and starts a second computation.
+        if error is None:
+            self.put(key, value)
+        with self._lock:
+            self._in_flight.pop(key, None)
+        if error is None:
+            future.set_result(value)
+        else:
+            future.set_exception(error)
+
+    def put(self, key: Hashable, value: Any) -> None:
+        nbytes = estimate_nbytes(value)
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else float("inf")
+        with self._lock:
+            self._remove(key)
+            if nbytes > self.max_bytes:
+                return
+            self._entries[key] = CacheEntry(value, nbytes, expires_at)
+            self.nbytes += nbytes
+            while self.nbytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._failed_at.clear()
+            self.nbytes = 0
+
+    def stats(self) -> Dict[str, Union[int, float, None]]:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self.nbytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "stale_hits": self.stale_hits, "coalesced": self.coalesced, "in_flight": len(self._in_flight),
+                    "refreshes": self.refreshes, "refresh_failures": self.refresh_failures,
+                    "last_refresh_seconds": self.last_refresh_seconds}
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.nbytes -= entry.nbytes
+
+
+def memoize(get_cache: Callable[[], ResultCache]) -> Callable:
+    """Decorator caching a function in ``get_cache()`` by its qualified name and arguments.
+
+    Arguments must be cheap, hashable parameters; lists are frozen to tuples
+    so colours like ``[36, 191, 242]`` can be passed as they are. Used as
+    ``@cached(update=fn)``, an expired entry is refreshed with
+    ``fn(stale, *args)`` instead of a full recomputation.
+    """
+    def decorator(func: Optional[Callable] = None, *, update: Optional[Callable] = None) -> Callable:
+        if func is None:
+            return functools.partial(decorator, update=update)
+        timed = perf.timed(func)
+
+        def compute(*args):
+            perf.count("cache_misses")
+            return timed(*args)
+
+        @functools.wraps(func)
+        def wrapper(*args):
+            key = (func.__module__, func.__qualname__, *(_freeze(arg) for arg in args))
+            perf.count("cache_lookups")
+            return get_cache().get_or_compute(
+                key, lambda: compute(*args), None if update is None else lambda stale: update(stale, *args))
+        return wrapper
+    return decorator
+
+
+def _freeze(value: Any) -> Hashable:
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def estimate_nbytes(value: Any) -> int:
+    """Approximate memory held by ``value``.
+
+    Exact for NumPy arrays and pandas objects; long lists and dicts, such as
+    the records of a pydeck layer, are extrapolated from a sample.
+    """
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+        usage = value.memory_usage(deep=True, index=True)
+        return int(usage.sum()) if isinstance(usage, pd.Series) else int(usage)
+    if isinstance(value, (str, bytes, int, float, bool, type(None))):
+        return sys.getsizeof(value)
+    if isinstance(value, dict):
+        # Keys are usually column names shared by every record.
+        return sys.getsizeof(value) + _sampled_nbytes(list(value.values()))
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value) + _sampled_nbytes(list(value))
+    if hasattr(value, "__dict__"):
+        return sys.getsizeof(value) + estimate_nbytes(vars(value))
+    return sys.getsizeof(value)
+
+
+def _sampled_nbytes(items: list) -> int:
+    if len(items) <= _SAMPLE_SIZE:
+        return sum(estimate_nbytes(item) for item in items)
+    step = len(items) / _SAMPLE_SIZE
+    sample = [items[int(i * step)] for i in range(_SAMPLE_SIZE)]
+    return int(sum(estimate_nbytes(item) for item in sample) * step)
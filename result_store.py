@@ -0,0 +1,96 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import Iterable, Iterator, Optional
+
+import pyarrow as pa
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.split())
+
+
+class ResultStore:
+    """Query results kept on disk as uncompressed Arrow IPC files.
+
+    Files are named after a hash of the normalized query text and read back
+    memory-mapped, so a hit costs a few page faults rather than a
+    deserialization pass. Results older than ``max_age`` seconds count as
+    misses; ``None`` keeps them until they are rewritten.
+    """
+
+    def __init__(self, directory: str = ".result_store", max_age: Optional[float] = None):
+        self.directory = directory
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, query: str) -> str:
+        digest = hashlib.sha256(normalize_query(query).encode()).hexdigest()
+        return os.path.join(self.directory, f"{digest}.arrow")
+
+    def get(self, query: str) -> Optional[pa.Table]:
+        table = self._read(self.path(query))
+        with self._lock:
+            if table is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return table
+
+    def _read(self, path: str) -> Optional[pa.Table]:
+        try:
+            if self.max_age is not None and time.time() - os.path.getmtime(path) > self.max_age:
+                return None
+            return pa.ipc.open_file(pa.memory_map(path)).read_all()
+        except FileNotFoundError:
+            return None
+        except (OSError, pa.ArrowInvalid):
+            logger.warning("dropping unreadable result file %s", path)
+            _remove_quietly(path)
+            return None
+
+    def write_through(self, query: str, batches: Iterable[pa.RecordBatch]) -> Iterator[pa.RecordBatch]:
+        """Yield ``batches`` unchanged while writing them to the store.
+
+        The file only replaces the stored result once every batch has been
+        written, so readers never see a partial result. Empty results and
+        results whose batches disagree on schema are passed through unstored.
+        """
+        path = self.path(query)
+        temp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        writer, schema = None, None
+        storing = True
+        try:
+            for batch in batches:
+                if storing:
+                    if writer is None:
+                        schema = batch.schema
+                        writer = pa.ipc.new_file(temp, schema)
+                    if batch.schema.equals(schema):
+                        writer.write_batch(batch)
+                    else:
+                        logger.warning("not storing %s: batch schemas differ", path)
+                        storing = False
+                yield batch
+            if storing and writer is not None:
+                writer.close()
+                writer = None
+                os.replace(temp, path)
+        finally:
+            if writer is not None:
+                writer.close()
+            _remove_quietly(temp)
+
+
+def _remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
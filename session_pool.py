@@ -0,0 +1,209 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, List, Optional
+
+HEALTH_CHECK_SQL = "select 1"
+
+
+class PooledSession:
+    def __init__(self, session: Any):
+        self.session = session
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.in_flight = 0
+
+
+class SessionPool:
+    """Lazily created, health-checked pool of Snowpark sessions.
+
+    ``factory`` is any zero-argument callable returning an object with
+    ``sql(query)`` and ``close()``, so a local stand-in can replace the real
+    ``Session`` builder.
+    """
+
+    def __init__(self,
+                 factory: Callable[[], Any],
+                 max_sessions: int = 4,
+                 max_in_flight_per_session: int = 1,
+                 health_check_interval: float = 300.0,
+                 keep_alive_interval: Optional[float] = 900.0,
+                 max_session_age: Optional[float] = None,
+                 acquire_timeout: Optional[float] = None):
+        if max_sessions < 1:
+            raise ValueError("max_sessions must be at least 1")
+        if max_in_flight_per_session < 1:
+            raise ValueError("max_in_flight_per_session must be at least 1")
+        self._factory = factory
+        self.max_sessions = max_sessions
+        self.max_in_flight_per_session = max_in_flight_per_session
+        self.health_check_interval = health_check_interval
+        self.keep_alive_interval = keep_alive_interval
+        self.max_session_age = max_session_age
+        self.acquire_timeout = acquire_timeout
+        self._sessions: List[PooledSession] = []
+        self._creating = 0
+        self._discarded = 0
+        self._lock = threading.Condition()
+        self._keep_alive_thread: Optional[threading.Thread] = None
+        self._closed = threading.Event()
+
+    @property
+    def size(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+    @property
+    def capacity(self) -> int:
+        """Most statements the pool runs at once."""
+        return self.max_sessions * self.max_in_flight_per_session
+
+    @contextmanager
+    def session(self, verify: bool = False) -> Iterator[Any]:
+        pooled = self._acquire(verify)
+        try:
+            yield pooled.session
+        except Exception:
+            # A failing statement may mean the session expired under us; drop
+            # it so the next caller reconnects instead of failing again.
+            if not self._is_healthy(pooled):
+                self._discard(pooled)
+                pooled = None
+            raise
+        finally:
+            if pooled is not None:
+                self._release(pooled)
+
+    def run(self, fn: Callable[[Any], Any], retries: int = 1) -> Any:
+        """Call ``fn(session)``, reconnecting and retrying if the session died."""
+        for attempt in range(retries + 1):
+            discarded_before = self._discarded
+            try:
+                with self.session(verify=attempt > 0) as session:
+                    return fn(session)
+            except Exception:
+                if attempt == retries or self._discarded == discarded_before:
+                    raise
+
+    def close(self) -> None:
+        self._closed.set()
+        with self._lock:
+            sessions, self._sessions = self._sessions, []
+            self._lock.notify_all()
+        for pooled in sessions:
+            _close_quietly(pooled.session)
+
+    def _acquire(self, verify: bool = False) -> PooledSession:
+        deadline = None if self.acquire_timeout is None else time.monotonic() + self.acquire_timeout
+        shared = False
+        with self._lock:
+            while True:
+                if self._closed.is_set():
+                    raise RuntimeError("Session pool is closed")
+                idle = [pooled for pooled in self._sessions if pooled.in_flight == 0]
+                if idle:
+                    pooled = max(idle, key=lambda p: p.last_used)
+                    pooled.in_flight += 1
+                    break
+                if len(self._sessions) + self._creating < self.max_sessions:
+                    self._creating += 1
+                    pooled = None
+                    break
+                # Every session is busy and the pool is full: share the least
+                # loaded session, up to max_in_flight_per_session statements.
+                available = [pooled for pooled in self._sessions
+                             if pooled.in_flight < self.max_in_flight_per_session]
+                if available:
+                    pooled = min(available, key=lambda p: p.in_flight)
+                    pooled.in_flight += 1
+                    shared = True
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError(f"No Snowflake session available within {self.acquire_timeout}s")
+                self._lock.wait(remaining)
+
+        if pooled is None:
+            return self._create()
+        if shared:
+            # Already running statements, so known to be alive.
+            return pooled
+        if (verify or self._needs_check(pooled)) and not self._is_healthy(pooled):
+            self._discard(pooled)
+            return self._acquire(verify)
+        return pooled
+
+    def _create(self) -> PooledSession:
+        try:
+            pooled = PooledSession(self._factory())
+        except Exception:
+            with self._lock:
+                self._creating -= 1
+                self._lock.notify()
+            raise
+        pooled.in_flight = 1
+        with self._lock:
+            self._creating -= 1
+            self._sessions.append(pooled)
+        self._start_keep_alive()
+        return pooled
+
+    def _release(self, pooled: PooledSession) -> None:
+        with self._lock:
+            pooled.in_flight = max(pooled.in_flight - 1, 0)
+            pooled.last_used = time.monotonic()
+            self._lock.notify()
+
+    def _discard(self, pooled: PooledSession) -> None:
+        with self._lock:
+            if pooled in self._sessions:
+                self._sessions.remove(pooled)
+                self._discarded += 1
+            self._lock.notify()
+        _close_quietly(pooled.session)
+
+    def _needs_check(self, pooled: PooledSession) -> bool:
+        now = time.monotonic()
+        if self.max_session_age is not None and now - pooled.created_at > self.max_session_age:
+            return True
+        return now - pooled.last_used > self.health_check_interval
+
+    def _is_healthy(self, pooled: PooledSession) -> bool:
+        if self.max_session_age is not None and time.monotonic() - pooled.created_at > self.max_session_age:
+            return False
+        try:
+            pooled.session.sql(HEALTH_CHECK_SQL).collect()
+        except Exception:
+            return False
+        return True
+
+    def _start_keep_alive(self) -> None:
+        if self.keep_alive_interval is None:
+            return
+        with self._lock:
+            if self._keep_alive_thread is not None:
+                return
+            self._keep_alive_thread = threading.Thread(
+                target=self._keep_alive_loop, name="snowflake-keep-alive", daemon=True)
+        self._keep_alive_thread.start()
+
+    def _keep_alive_loop(self) -> None:
+        while not self._closed.wait(self.keep_alive_interval):
+            with self._lock:
+                due = [pooled for pooled in self._sessions
+                       if pooled.in_flight == 0
+                       and time.monotonic() - pooled.last_used >= self.keep_alive_interval]
+                for pooled in due:
+                    pooled.in_flight += 1
+            for pooled in due:
+                if self._is_healthy(pooled):
+                    self._release(pooled)
+                else:
+                    self._discard(pooled)
+
+
+def _close_quietly(session: Any) -> None:
+    try:
+        session.close()
+    except Exception:
+        pass
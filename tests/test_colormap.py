@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+import pytest
+from branca.colormap import LinearColormap
+
+from colormap import COLOR_SCHEMES, linear_colors
+
+
+def branca_colors(counts: pd.Series, colors, index: pd.Series, alpha: bool) -> np.ndarray:
+    # As main.py built its colours before linear_colors.
+    color_map = LinearColormap(colors, vmin=index.min(), vmax=index.max(), index=index)
+    convert = color_map.rgba_bytes_tuple if alpha else color_map.rgb_bytes_tuple
+    return np.array(counts.apply(convert).tolist(), dtype=np.uint8)
+
+
+@pytest.mark.parametrize("alpha", [False, True])
+@pytest.mark.parametrize("scheme", COLOR_SCHEMES)
+def test_matches_branca(scheme, alpha):
+    counts = pd.Series(np.random.default_rng(0).lognormal(3, 2, 1000).round())
+    scheme = COLOR_SCHEMES[scheme]
+    index = counts.quantile(scheme.quantiles)
+    # Values on the stops themselves and outside them too.
+    counts = pd.concat([counts, index, pd.Series([-1.0, counts.max() + 1])], ignore_index=True)
+
+    colors = linear_colors(counts.to_numpy(), scheme.colors, index.to_numpy(), alpha)
+
+    assert colors.dtype == np.uint8 and colors.flags.c_contiguous
+    np.testing.assert_array_equal(colors, branca_colors(counts, scheme.colors, index, alpha))
+
+
+@pytest.mark.parametrize("scheme", COLOR_SCHEMES)
+def test_constant_data_matches_branca(scheme):
+    counts = pd.Series([7.0] * 10)
+    scheme = COLOR_SCHEMES[scheme]
+    index = counts.quantile(scheme.quantiles)
+
+    colors = linear_colors(counts.to_numpy(), scheme.colors, index.to_numpy())
+
+    np.testing.assert_array_equal(colors, branca_colors(counts, scheme.colors, index, False))
+
+
+def test_unsorted_index():
+    with pytest.raises(ValueError):
+        linear_colors(np.array([1.0]), ["red", "blue"], [1.0, 0.0])
@@ -0,0 +1,44 @@
+import h3.api.basic_int as h3
+import numpy as np
+import pytest
+
+from h3_grid import (MAX_GRID_RES, cell_to_children, cell_to_parent, cells_to_strings, get_resolution, grid_cells,
+                     is_pentagon)
+
+
+def h3_grid(resolution: int) -> np.ndarray:
+    cells = h3.get_res0_cells()
+    if resolution:
+        cells = [child for cell in cells for child in h3.cell_to_children(cell, resolution)]
+    return np.sort(np.array(cells, dtype=np.uint64))
+
+
+@pytest.mark.parametrize("resolution", range(MAX_GRID_RES + 1))
+def test_grid_cells(resolution):
+    cells = grid_cells(resolution)
+
+    assert len(cells) == h3.get_num_cells(resolution)
+    np.testing.assert_array_equal(np.sort(cells), h3_grid(resolution))
+    assert (get_resolution(cells) == resolution).all()
+    np.testing.assert_array_equal(np.flatnonzero(is_pentagon(cells)),
+                                  np.flatnonzero(np.isin(cells, h3.get_pentagons(resolution))))
+
+
+@pytest.mark.parametrize("resolution", range(1, MAX_GRID_RES + 1))
+def test_cell_to_parent(resolution):
+    cells = grid_cells(resolution)
+    for parent_resolution in range(resolution):
+        expected = [h3.cell_to_parent(cell, parent_resolution) for cell in cells.tolist()]
+        np.testing.assert_array_equal(cell_to_parent(cells, parent_resolution), np.array(expected, dtype=np.uint64))
+
+
+def test_cell_to_children():
+    # Every base cell, pentagons included.
+    cells = grid_cells(0)
+    expected = [child for cell in cells.tolist() for child in sorted(h3.cell_to_children(cell, 1))]
+    np.testing.assert_array_equal(cell_to_children(cells, 1), np.array(expected, dtype=np.uint64))
+
+
+def test_cells_to_strings():
+    cells = grid_cells(2)
+    assert cells_to_strings(cells).tolist() == [h3.int_to_str(cell) for cell in cells.tolist()]
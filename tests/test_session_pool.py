@@ -0,0 +1,110 @@
+import pytest
+
+from session_pool import SessionPool
+
+
+class FakeResult:
+    def __init__(self, session: "FakeSession", query: str):
+        self.session = session
+        self.query = query
+
+    def collect(self):
+        if not self.session.alive:
+            raise ConnectionError("session expired")
+        self.session.queries.append(self.query)
+        return [self.query]
+
+
+class FakeSession:
+    def __init__(self):
+        self.alive = True
+        self.closed = False
+        self.queries = []
+
+    def sql(self, query: str) -> FakeResult:
+        return FakeResult(self, query)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeFactory:
+    def __init__(self):
+        self.sessions = []
+
+    def __call__(self) -> FakeSession:
+        session = FakeSession()
+        self.sessions.append(session)
+        return session
+
+
+def make_pool(**kwargs):
+    factory = FakeFactory()
+    return factory, SessionPool(factory, keep_alive_interval=None, **kwargs)
+
+
+def test_sessions_are_created_lazily():
+    factory, pool = make_pool()
+    assert factory.sessions == [] and pool.size == 0
+
+    assert pool.run(lambda session: session.sql("select 2").collect()) == ["select 2"]
+    pool.run(lambda session: session.sql("select 3").collect())
+
+    assert len(factory.sessions) == 1 and pool.size == 1
+    assert factory.sessions[0].queries == ["select 2", "select 3"]
+
+
+def test_max_sessions_caps_the_pool():
+    factory, pool = make_pool(max_sessions=2, acquire_timeout=0.05)
+    with pool.session() as first, pool.session() as second:
+        assert first is not second
+        with pytest.raises(TimeoutError):
+            with pool.session():
+                pass
+    assert len(factory.sessions) == 2 and pool.size == 2
+
+
+def test_busy_sessions_are_shared_up_to_max_in_flight():
+    factory, pool = make_pool(max_sessions=1, max_in_flight_per_session=2, acquire_timeout=0.05)
+    with pool.session() as first, pool.session() as second:
+        assert first is second
+        with pytest.raises(TimeoutError):
+            with pool.session():
+                pass
+    assert len(factory.sessions) == 1
+
+
+def test_dead_session_is_replaced_and_the_call_retried():
+    factory, pool = make_pool()
+    pool.run(lambda session: session.sql("select 2").collect())
+    factory.sessions[0].alive = False
+
+    assert pool.run(lambda session: session.sql("select 3").collect()) == ["select 3"]
+
+    dead, fresh = factory.sessions
+    assert dead.closed and not fresh.closed
+    assert fresh.queries == ["select 3"]
+    assert pool.size == 1
+
+
+def test_statement_errors_on_a_healthy_session_are_not_retried():
+    factory, pool = make_pool()
+    calls = []
+
+    def fail(session):
+        calls.append(session)
+        raise ValueError("bad statement")
+
+    with pytest.raises(ValueError):
+        pool.run(fail)
+    assert len(calls) == 1 and len(factory.sessions) == 1 and pool.size == 1
+
+
+def test_closed_pool_closes_its_sessions():
+    factory, pool = make_pool()
+    pool.run(lambda session: None)
+    pool.close()
+
+    assert factory.sessions[0].closed
+    with pytest.raises(RuntimeError):
+        pool.run(lambda session: None)